@@ -0,0 +1,75 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from common.project_types import ChapterInfo
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChapterDiff:
+    new: list[ChapterInfo] = field(default_factory=list)
+    removed: list[ChapterInfo] = field(default_factory=list)
+    reordered: list[ChapterInfo] = field(default_factory=list)
+    date_changed: list[ChapterInfo] = field(default_factory=list)
+    # переименованные главы не перекачиваются, в БД нужно только обновить название для оглавления epub
+    renamed: list[ChapterInfo] = field(default_factory=list)
+
+    @property
+    def changed_links(self) -> set[str]:
+        """Ссылки глав, которые нужно скачать заново: новые, сдвинутые и с новой датой"""
+        return {chapter.chapter_link for chapter in (*self.new, *self.reordered, *self.date_changed)}
+
+    @property
+    def renamed_links(self) -> set[str]:
+        return {chapter.chapter_link for chapter in self.renamed}
+
+    def __bool__(self) -> bool:
+        return bool(self.new or self.removed or self.reordered or self.date_changed or self.renamed)
+
+    def __str__(self) -> str:
+        return (f'новых глав {len(self.new)}, удаленных {len(self.removed)}, '
+                f'сдвинутых {len(self.reordered)}, с новой датой {len(self.date_changed)}, '
+                f'переименованных {len(self.renamed)}')
+
+
+def diff_chapters(old_chapters: Iterable[ChapterInfo], new_chapters: Iterable[ChapterInfo]) -> ChapterDiff:
+    """Сравнивает главы из БД с оглавлением на сайте за линейное время, ключ - ссылка на главу.
+    В главы с сайта переносятся из БД данные, которых нет в оглавлении: размер, количество слов, хэш текста и неизвестные даты"""
+    old_chapters_by_link = {chapter.chapter_link: chapter for chapter in old_chapters}
+    new_links = set()
+    chapter_diff = ChapterDiff()
+    for chapter in new_chapters:
+        new_links.add(chapter.chapter_link)
+        old_chapter = old_chapters_by_link.get(chapter.chapter_link)
+        if old_chapter is None:
+            chapter_diff.new.append(chapter)
+            continue
+        if chapter.chapter_file_name != old_chapter.chapter_file_name:
+            chapter_diff.reordered.append(chapter)
+        elif _is_date_changed(old_chapter, chapter):
+            chapter_diff.date_changed.append(chapter)
+        if chapter.chapter_name != old_chapter.chapter_name:
+            chapter_diff.renamed.append(chapter)
+        _carry_over_chapter_data(old_chapter, chapter)
+    chapter_diff.removed = [chapter for link, chapter in old_chapters_by_link.items() if link not in new_links]
+    logger.debug(f'Изменения в главах: {chapter_diff}')
+    return chapter_diff
+
+
+def _is_date_changed(old_chapter: ChapterInfo, new_chapter: ChapterInfo) -> bool:
+    # не все сайты показывают даты в оглавлении, нулевая дата значит "неизвестно", а не "изменилась"
+    return any(new_date and new_date != old_date for old_date, new_date in
+               ((old_chapter.chapter_posted_date, new_chapter.chapter_posted_date),
+                (old_chapter.chapter_updated_date, new_chapter.chapter_updated_date)))
+
+
+def _carry_over_chapter_data(old_chapter: ChapterInfo, new_chapter: ChapterInfo) -> None:
+    new_chapter.chapter_size = old_chapter.chapter_size
+    new_chapter.chapter_word_count = old_chapter.chapter_word_count
+    # хэш относится к файлу главы, у сдвинутой главы по ее новому имени файла лежит другой текст
+    if new_chapter.chapter_file_name == old_chapter.chapter_file_name:
+        new_chapter.chapter_digest = old_chapter.chapter_digest
+    new_chapter.chapter_posted_date = new_chapter.chapter_posted_date or old_chapter.chapter_posted_date
+    new_chapter.chapter_updated_date = new_chapter.chapter_updated_date or old_chapter.chapter_updated_date
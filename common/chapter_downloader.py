@@ -0,0 +1,107 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, TypeVar
+
+from requests import Session
+from tqdm import tqdm
+
+from settings.settings import DEFAULT_HOST_CONCURRENCY, HOST_CONCURRENCY_LIMITS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+_host_semaphores: dict[str, threading.BoundedSemaphore] = {}
+_host_semaphores_lock = threading.Lock()
+# сайты, слот которых уже занял текущий поток: вложенные запросы к тому же сайту идут в этом же слоте
+_held_sites = threading.local()
+
+
+class SharedSession:
+    """Сессия, общая для всех потоков загрузки книги. Когда соединение рвется, переподключается один поток,
+    остальные берут уже новую сессию, а не продолжают работать с оборванной"""
+
+    def __init__(self, session: Session) -> None:
+        self.session = session
+        self._lock = threading.Lock()
+
+    def reconnect(self, failed_session: Session, create_session: Callable[[], Session], delay: float = 30) -> Session:
+        with self._lock:
+            if self.session is failed_session:
+                time.sleep(delay)
+                self.session = create_session()
+            return self.session
+
+
+def get_host_concurrency(site_name: str) -> int:
+    """Максимальное количество одновременных запросов к сайту"""
+    return HOST_CONCURRENCY_LIMITS.get(site_name, DEFAULT_HOST_CONCURRENCY)
+
+
+def _get_host_semaphore(site_name: str) -> threading.BoundedSemaphore:
+    """Семафор общий для всех загрузчиков сайта, чтобы лимит соблюдался даже при скачивании нескольких книг сразу"""
+    with _host_semaphores_lock:
+        semaphore = _host_semaphores.get(site_name)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(get_host_concurrency(site_name))
+            _host_semaphores[site_name] = semaphore
+        return semaphore
+
+
+def is_limited_site(site_name: str) -> bool:
+    """Для сайта задан свой лимит одновременных запросов"""
+    return site_name in HOST_CONCURRENCY_LIMITS
+
+
+def holds_host_slot(site_name: str) -> bool:
+    return site_name in _get_held_sites()
+
+
+@contextmanager
+def host_slot(site_name: str) -> Iterator[None]:
+    """Занимает один из слотов одновременных запросов к сайту. Если поток уже занял слот этого сайта
+    (например картинки главы качаются внутри загрузки главы), второй слот не берется"""
+    held_sites = _get_held_sites()
+    if site_name in held_sites:
+        yield
+        return
+    with _get_host_semaphore(site_name):
+        held_sites.add(site_name)
+        try:
+            yield
+        finally:
+            held_sites.discard(site_name)
+
+
+def _get_held_sites() -> set[str]:
+    held_sites: set[str] | None = getattr(_held_sites, 'sites', None)
+    if held_sites is None:
+        held_sites = _held_sites.sites = set()
+    return held_sites
+
+
+def download_concurrently(site_name: str, items: Iterable[T], worker: Callable[[T], None], desc: str) -> None:
+    """Выполняет worker для каждого элемента в пуле потоков с ограничением одновременных запросов к сайту.
+    Результаты worker записывает сам (в свой ChapterInfo и файл главы), поэтому порядок глав не зависит от порядка завершения"""
+    items = list(items)
+    if not items:
+        return
+
+    def run_limited(item: T) -> None:
+        with host_slot(site_name):
+            worker(item)
+
+    max_workers = min(get_host_concurrency(site_name), len(items))
+    logger.debug('Скачиваем %s элементов с %s в %s потоков', len(items), site_name, max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_limited, item) for item in items]
+        try:
+            for future in tqdm(as_completed(futures), total=len(futures), desc=desc, colour='green'):
+                future.result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
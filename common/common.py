@@ -1,24 +1,30 @@
+import hashlib
 import logging
 import random
-import time
+from functools import partial
 from pathlib import Path
+from typing import Callable, TypeVar
 
+import bs4
 import requests.exceptions
-from bs4 import BeautifulSoup
 from requests import Session
-from tqdm import tqdm
 
+from common.chapter_diff import diff_chapters
+from common.chapter_downloader import SharedSession, download_concurrently
 from common.exceptions import ParsingException
+from common.image_store import save_images
 from common.project_types import ChapterInfo, site_names_type
 from common.request_authorization import create_request_session
-from common.utils import create_soup
-from common.utils import form_acceptable_name, request_get_image
+from common.utils import form_acceptable_name
 from db_modules.db_common import BookDB
 from db_modules.db_common import check_book_link_in_db
 from epub.epub import BookEpub
 
 logger = logging.getLogger(__name__)
 
+# глава обрабатывается как тэг внутри уже разобранной страницы, целый BeautifulSoup тоже подходит
+TagType = TypeVar('TagType', bound=bs4.Tag)
+
 
 class Book(BookDB, BookEpub):
 
@@ -43,15 +49,7 @@ class Book(BookDB, BookEpub):
         logger.debug(f'Начинаем скачивание книги {self.book_link}')
 
         self._get_book_info(session)
-        for chapter in tqdm(self.chapters_info_list, desc='Скачивание всех глав книги', colour='green'):
-            try:
-                self._download_chapter(chapter, session)
-            except requests.exceptions.ConnectionError:  # в случае потери соединенеия, переподключение через 30с
-                logger.exception('Дисконект')
-                time.sleep(30)
-                session = self._create_auth_session()
-                self._download_chapter(chapter, session)
-            time.sleep(random.randint(1, 3))
+        self._download_chapters(self.chapters_info_list, session, desc='Скачивание всех глав книги')
         self.calculate_book_size()
         self.add_book_to_db()
         self.compile_epub_file()
@@ -60,18 +58,79 @@ class Book(BookDB, BookEpub):
         """Обновление storiesonline книги"""
         logger.debug('Начинаем обновление книги')
         self.read_book_info_from_db()
-        sorted_chapters_list_in_db = self._get_sorted_chapters()
+        chapters_in_db = self.chapters_info_list
+        last_chapter_link_in_db = self._get_sorted_chapters()[-1]
         book_updated_date_in_db = self.book_updated_date
+        if not self._probe_book_updated(session, book_updated_date_in_db):
+            logger.debug(f'Книга {self.book_link} не обновлялась')
+            return
+        # оглавление берем с сайта целиком, с главами из БД сравниваем через diff_chapters
+        self.chapters_info_list = []
         self._get_book_info(session)
         if self.book_updated_date > book_updated_date_in_db:
             logger.debug(f'{self.book_updated_date}, {book_updated_date_in_db}')
-            for chapter in tqdm(self.chapters_info_list, desc='Скачивание обновленных глав книги', colour='green'):
-                if chapter.chapter_link not in sorted_chapters_list_in_db[:-1]:
-                    self._download_chapter(chapter, session)
-                    time.sleep(random.randint(1, 3))
+            chapter_diff = diff_chapters(chapters_in_db, self.chapters_info_list)
+            # последнюю главу из БД качаем всегда, ее могли дописать
+            links_to_download = chapter_diff.changed_links | {last_chapter_link_in_db}
+            chapters_to_download = [chapter for chapter in self.chapters_info_list if chapter.chapter_link in links_to_download]
+            changed_chapters = self._download_changed_chapters(chapters_to_download, session, desc='Скачивание обновленных глав книги')
+            # у переименованных глав текст не перекачивается, но новое название нужно в БД и оглавлении epub
+            links_to_write = chapter_diff.changed_links | chapter_diff.renamed_links | {chapter.chapter_link for chapter in changed_chapters}
+            chapters_to_write = [chapter for chapter in self.chapters_info_list if chapter.chapter_link in links_to_write]
             self.calculate_book_size()
-            self.update_book_in_db()
-            self.compile_epub_file()
+            self.update_book_in_db(chapters_to_write)
+            if chapter_diff.removed:
+                self.delete_chapters_from_db(chapter_diff.removed)
+                self.compile_epub_file()
+            elif chapters_to_write:
+                self.compile_epub_file(changed_chapters=[chapter.chapter_file_name for chapter in chapters_to_write])
+            else:
+                logger.debug(f'Тексты глав книги {self.book_link} не изменились, epub не пересобираем')
+
+    def verify_chapters(self, session: Session, sample_size: int) -> None:
+        """Перекачивает случайную выборку сохраненных глав и сравнивает хэши текста с БД.
+        Так находятся правки автора в старых главах, после которых дата книги не меняется.
+        Вызывается на отдельном экземпляре книги: данные книги читаются из БД заново"""
+        self.chapters_info_list = []
+        self.read_book_info_from_db()
+        chapters_to_verify = random.sample(self.chapters_info_list, min(sample_size, len(self.chapters_info_list)))
+        # у глав, сохраненных до появления хэшей, сравнивать не с чем, для них хэш только записываем в БД
+        unhashed_links = {chapter.chapter_link for chapter in chapters_to_verify if not chapter.chapter_digest}
+        changed_chapters = self._download_changed_chapters(chapters_to_verify, session, desc='Проверка глав книги')
+        edited_chapters = [chapter for chapter in changed_chapters if chapter.chapter_link not in unhashed_links]
+        if not changed_chapters:
+            logger.debug(f'Проверенные главы книги {self.book_link} не изменились')
+            return
+        self.calculate_book_size()
+        self.update_book_in_db(changed_chapters)
+        if edited_chapters:
+            logger.info(f'В книге {self.book_link} изменились главы: {[chapter.chapter_name for chapter in edited_chapters]}')
+            self.compile_epub_file(changed_chapters=[chapter.chapter_file_name for chapter in edited_chapters])
+
+    def _download_changed_chapters(self, chapters: list[ChapterInfo], session: Session, desc: str) -> list[ChapterInfo]:
+        """Скачивает главы и возвращает те, у которых изменился хэш текста"""
+        digests_before = {chapter.chapter_link: chapter.chapter_digest for chapter in chapters}
+        self._download_chapters(chapters, session, desc)
+        return [chapter for chapter in chapters if chapter.chapter_digest != digests_before[chapter.chapter_link]]
+
+    def _download_chapters(self, chapters: list[ChapterInfo], session: Session, desc: str) -> None:
+        """Параллельное скачивание глав. Каждая глава пишется в свой файл и свой ChapterInfo, порядок глав сохраняется"""
+        shared_session = SharedSession(session)
+        download_concurrently(self.site_name, chapters, lambda chapter: self._run_with_reconnect(partial(self._download_chapter, chapter), shared_session), desc)
+
+    def _run_with_reconnect(self, download: Callable[[Session], None], shared_session: SharedSession) -> None:
+        session = shared_session.session
+        try:
+            download(session)
+        except requests.exceptions.ConnectionError:  # в случае потери соединенеия, переподключение через 30с
+            logger.exception('Дисконект')
+            session = shared_session.reconnect(session, self._create_auth_session)
+            download(session)
+
+    def _probe_book_updated(self, session: Session, book_updated_date_in_db: int) -> bool:
+        """Быстрая проверка обновления книги одним дешевым запросом, до полного парсинга.
+        False только если точно известно, что книга не обновлялась. По умолчанию проверки нет"""
+        return True
 
     def _get_book_info(self, session: Session) -> None:
         raise NotImplementedError('Метод не переопределен _get_book_info')
@@ -110,49 +169,35 @@ class Book(BookDB, BookEpub):
         logger.debug('Сохраняем текст главы на диск')
         book_directory = Path(self.book_directory)
         chapter_path = book_directory.joinpath(f'Text/{chapter_info.chapter_file_name}')
+        chapter_digest = hashlib.sha256(chapter_text.encode('utf-8')).hexdigest()
+        if chapter_digest == chapter_info.chapter_digest and chapter_path.exists():
+            logger.debug('Глава %s не изменилась, не перезаписываем', chapter_info.chapter_file_name)
+            return chapter_path
         try:
             chapter_path.write_text(chapter_text, encoding='utf-8')
         except PermissionError:
             error_message = f'Не могу сохранить на диск {chapter_path=}'
             logger.error(error_message)
             raise ParsingException(error_message)
+        chapter_info.chapter_digest = chapter_digest
         return chapter_path
 
-    @staticmethod
-    def _save_image(image_link: str, book_path: Path) -> str:
-        image_name = 'Images/' + image_link.split('/')[-1]
-        image_path = book_path.joinpath(image_name)
-        if image_path.exists():
-            return image_name
-        else:
-            image_response = request_get_image(image_link)
-            if image_response.status_code == 200:
-                image = image_response.content
-                image_path.write_bytes(image)
-                return image_name
-            elif image_response.status_code == 404:
-                return image_name
-            else:
-                error_message = f'Ошибка {image_response.status_code} загрузки изображения {image_name} в тексте главы'
-                logger.error(error_message)
-                raise ParsingException(error_message)
-
-    def _get_chapter_images(self, soup: BeautifulSoup) -> BeautifulSoup:
+    def _get_chapter_images(self, soup: TagType) -> TagType:
         """функция получения картинок в главе"""
         logger.debug('сохраняем изображения из текста')
-        images = soup.findAll('img')
+        images = [image for image in soup.findAll('img') if image.get('src')]
+        image_file_names = save_images((image.get('src') for image in images), Path(self.book_directory, 'Images'))
         for image in images:
-            image_link = image.get('src')
-            local_image_path = self._save_image(image_link, self.book_directory)
-            if local_image_path:
-                image['src'] = '../' + local_image_path  # добавлил ../ вначале адреса тэга, чтобы работало в .epub книгах
+            image_file_name = image_file_names.get(image.get('src'))
+            if image_file_name:
+                image['src'] = '../Images/' + image_file_name  # добавлил ../ вначале адреса тэга, чтобы работало в .epub книгах
         return soup
 
     @staticmethod
-    def _get_chapter_size(chapter_text: str) -> int:
-        chapter_text = create_soup(chapter_text).get_text()
-        chapter_size = len(chapter_text.encode('utf-8'))
-        return int(chapter_size / 1024)
+    def _measure_chapter(chapter_info: ChapterInfo, chapter_plain_text: str) -> None:
+        """Размер главы в Кб и количество слов по тексту главы, извлеченному из уже готового soup"""
+        chapter_info.chapter_size = int(len(chapter_plain_text.encode('utf-8')) / 1024)
+        chapter_info.chapter_word_count = len(chapter_plain_text.split())
 
     def calculate_book_size(self) -> None:
         book_size = 0
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any
+
+from requests import Response, Session
+
+logger = logging.getLogger(__name__)
+
+HTTP_CACHE_DIR = Path('temp/http_cache')
+FROM_CACHE_HEADER = 'X-From-Cache'
+
+
+def cached_get(session: Session, url: str, **kwargs: Any) -> Response:
+    """GET запрос с условной загрузкой: отправляет If-None-Match/If-Modified-Since по сохраненным валидаторам,
+    при ответе 304 возвращает тело страницы из кэша на диске. Работает с любой сессией из create_request_session/create_auth_session"""
+    cache_key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    cache_entry = _load_cache_entry(cache_key)
+    headers = dict(kwargs.pop('headers', None) or {})
+    if cache_entry is not None:
+        if cache_entry['etag']:
+            headers['If-None-Match'] = cache_entry['etag']
+        if cache_entry['last_modified']:
+            headers['If-Modified-Since'] = cache_entry['last_modified']
+
+    response = session.get(url, headers=headers, **kwargs)
+    if response.status_code == 304 and cache_entry is not None:
+        body = _load_cache_body(cache_key)
+        if body is None:
+            logger.debug('Тело страницы %s пропало из кэша, запрашиваем заново', url)
+            return session.get(url, **kwargs)
+        logger.debug('Страница не изменилась, берем из кэша %s', url)
+        response.status_code = 200
+        response.reason = 'OK'
+        response._content = body
+        response.headers.update(cache_entry['headers'])
+        response.headers[FROM_CACHE_HEADER] = '1'
+        response.encoding = cache_entry['encoding']
+    elif response.status_code == 200 and ('ETag' in response.headers or 'Last-Modified' in response.headers):
+        _save_cache_entry(cache_key, response)
+    return response
+
+
+def is_cached_response(response: Response) -> bool:
+    """True, если тело ответа взято из кэша (сервер ответил 304)"""
+    return response.headers.get(FROM_CACHE_HEADER) == '1'
+
+
+def _load_cache_entry(cache_key: str) -> dict[str, Any] | None:
+    meta_path = HTTP_CACHE_DIR.joinpath(f'{cache_key}.json')
+    try:
+        cache_entry: dict[str, Any] = json.loads(meta_path.read_text(encoding='utf-8'))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return cache_entry
+
+
+def _load_cache_body(cache_key: str) -> bytes | None:
+    try:
+        return HTTP_CACHE_DIR.joinpath(f'{cache_key}.body').read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def _save_cache_entry(cache_key: str, response: Response) -> None:
+    cache_entry = {'url': response.url,
+                   'etag': response.headers.get('ETag', ''),
+                   'last_modified': response.headers.get('Last-Modified', ''),
+                   'encoding': response.encoding,
+                   'headers': {name: value for name, value in response.headers.items()
+                               if name.lower() in ('content-type', 'etag', 'last-modified')}}
+    try:
+        HTTP_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # сначала тело, потом валидаторы, чтобы валидаторы никогда не указывали на недописанное тело
+        _write_atomic(HTTP_CACHE_DIR.joinpath(f'{cache_key}.body'), response.content)
+        _write_atomic(HTTP_CACHE_DIR.joinpath(f'{cache_key}.json'), json.dumps(cache_entry).encode('utf-8'))
+    except OSError:
+        logger.exception(f'Не могу сохранить страницу в кэш {response.url}')
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    temp_path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    temp_path.write_bytes(data)
+    os.replace(temp_path, path)
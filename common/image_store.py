@@ -0,0 +1,127 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable
+from urllib.parse import urlparse
+
+from requests import Session
+
+from common.chapter_downloader import holds_host_slot, host_slot, is_limited_site
+from common.exceptions import ParsingException
+from common.request_authorization import create_request_session
+from db_modules.db_common import get_image_file_name, save_image_file_name
+from settings.settings import IMAGE_FETCH_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# картинки всех книг лежат здесь один раз, в папках книг только жесткие ссылки на эти файлы
+IMAGE_STORE_DIR = Path('book_database/_images')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.svg')
+DEFAULT_IMAGE_EXTENSION = '.jpg'
+
+_image_session: Session | None = None
+_image_session_lock = threading.Lock()
+# один пул на все загрузки: потоки живут долго, поэтому их соединения с БД и http переиспользуются
+_image_executor: ThreadPoolExecutor | None = None
+_image_executor_lock = threading.Lock()
+
+
+def _get_image_session() -> Session:
+    """Одна сессия на все загрузки картинок, соединения с хостами переиспользуются"""
+    global _image_session
+    with _image_session_lock:
+        if _image_session is None:
+            _image_session = create_request_session()
+        return _image_session
+
+
+def _get_image_executor() -> ThreadPoolExecutor:
+    global _image_executor
+    with _image_executor_lock:
+        if _image_executor is None:
+            _image_executor = ThreadPoolExecutor(max_workers=IMAGE_FETCH_WORKERS, thread_name_prefix='image-fetch')
+        return _image_executor
+
+
+def store_image(image_link: str) -> Path | None:
+    """Путь к картинке в общем хранилище, скачивает ее, если по этой ссылке еще не скачивали.
+    None, если картинки на сайте нет"""
+    image_file_name = get_image_file_name(image_link)
+    if image_file_name is not None:
+        image_path = IMAGE_STORE_DIR.joinpath(image_file_name)
+        if image_path.exists():
+            return image_path
+    # картинка с сайта книги считается в его лимите одновременных запросов, как и главы
+    with host_slot(_get_image_site(image_link)):
+        image_response = _get_image_session().get(image_link)
+    if image_response.status_code == 404:
+        logger.debug('Картинки нет на сайте %s', image_link)
+        return None
+    if image_response.status_code != 200:
+        error_message = f'Ошибка {image_response.status_code} загрузки изображения {image_link}'
+        logger.error(error_message)
+        raise ParsingException(error_message)
+    image = image_response.content
+    image_file_name = hashlib.sha256(image).hexdigest() + _get_image_extension(image_link)
+    image_path = IMAGE_STORE_DIR.joinpath(image_file_name)
+    if not image_path.exists():
+        IMAGE_STORE_DIR.mkdir(parents=True, exist_ok=True)
+        temp_path = image_path.with_name(f'{image_file_name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        temp_path.write_bytes(image)
+        os.replace(temp_path, image_path)
+    save_image_file_name(image_link, image_file_name)
+    return image_path
+
+
+def link_image(image_path: Path, book_image_path: Path) -> None:
+    """Кладет картинку из хранилища в папку книги жесткой ссылкой, если файловая система не умеет - копией"""
+    if book_image_path.exists():
+        if os.path.samefile(image_path, book_image_path):
+            return
+        book_image_path.unlink()
+    try:
+        os.link(image_path, book_image_path)
+    except OSError:
+        logger.debug('Не получилось создать жесткую ссылку на %s, копируем', image_path)
+        shutil.copyfile(image_path, book_image_path)
+
+
+def save_images(image_links: Iterable[str], images_directory: Path) -> dict[str, str]:
+    """Сохраняет картинки в хранилище и папку книги. Возвращает имена файлов в папке книги по ссылкам,
+    картинок, которых нет на сайте, в результате нет.
+    Картинки со сторонних хостов качаются параллельно в общем пуле. Картинки с сайтов со своим лимитом запросов
+    качаются в вызывающем потоке в слоте сайта: слоты держат потоки загрузки глав, которые сами ждут пул картинок,
+    и потоки пула, ждущие слот, могли бы его заблокировать"""
+    image_links = list(dict.fromkeys(image_links))
+    if not image_links:
+        return {}
+    image_futures = {image_link: _get_image_executor().submit(store_image, image_link) for image_link in image_links
+                     if not _is_fetched_in_caller(image_link)}
+    image_paths = {image_link: store_image(image_link) for image_link in image_links if image_link not in image_futures}
+    image_paths.update((image_link, future.result()) for image_link, future in image_futures.items())
+    image_file_names = {}
+    for image_link in image_links:
+        image_path = image_paths[image_link]
+        if image_path is not None:
+            link_image(image_path, images_directory.joinpath(image_path.name))
+            image_file_names[image_link] = image_path.name
+    return image_file_names
+
+
+def _get_image_site(image_link: str) -> str:
+    parsed_link = urlparse(image_link)
+    return f'{parsed_link.scheme}://{parsed_link.netloc}'
+
+
+def _is_fetched_in_caller(image_link: str) -> bool:
+    image_site = _get_image_site(image_link)
+    return holds_host_slot(image_site) or is_limited_site(image_site)
+
+
+def _get_image_extension(image_link: str) -> str:
+    image_extension = Path(urlparse(image_link).path).suffix.lower()
+    return image_extension if image_extension in IMAGE_EXTENSIONS else DEFAULT_IMAGE_EXTENSION
@@ -0,0 +1,90 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Literal
+
+from common.exceptions import CompileException, DataBaseExceptions, GetPageSourseException, ParsingException
+
+logger = logging.getLogger(__name__)
+
+check_status_type = Literal['ok', 'error', 'timeout', 'skipped']
+
+
+@dataclass
+class SiteCheckResult:
+    site_name: str
+    status: check_status_type = 'ok'
+    duration: float = 0.0
+    error: str = ''
+
+
+# потоки проверок прошлых циклов, которые еще не завершились (зависли дольше таймаута)
+_running_checks: dict[str, threading.Thread] = {}
+# поток фоновых проверок, запущенных после цикла мониторинга
+_background_thread: threading.Thread | None = None
+
+
+def _run_site_check(site_name: str, check: Callable[[], None], result: SiteCheckResult) -> None:
+    start_time = time.monotonic()
+    try:
+        check()
+    except (GetPageSourseException, DataBaseExceptions, ParsingException, CompileException) as e:
+        logger.exception(f'Ошибка запланированная {site_name}')
+        result.status, result.error = 'error', repr(e)
+    except Exception as e:
+        logger.exception(f'Незапланированная ошибка {site_name}')
+        result.status, result.error = 'error', repr(e)
+    result.duration = time.monotonic() - start_time
+
+
+def run_site_checks(checks: dict[str, Callable[[], None]], timeout: float) -> list[SiteCheckResult]:
+    """Запускает проверку каждого сайта в своем потоке и ждет все проверки не дольше timeout секунд.
+    Каждая проверка создает свою сессию, лимит запросов у каждого сайта свой"""
+    results: dict[str, SiteCheckResult] = {}
+    threads: dict[str, threading.Thread] = {}
+    for site_name, check in checks.items():
+        previous_thread = _running_checks.get(site_name)
+        if previous_thread is not None and previous_thread.is_alive():
+            logger.error(f'Проверка {site_name} с прошлого цикла еще не завершилась, пропускаем')
+            results[site_name] = SiteCheckResult(site_name, status='skipped')
+            continue
+        result = SiteCheckResult(site_name)
+        thread = threading.Thread(target=_run_site_check, args=(site_name, check, result), name=f'monitoring-{site_name}', daemon=True)
+        thread.start()
+        results[site_name] = result
+        threads[site_name] = thread
+        _running_checks[site_name] = thread
+
+    deadline = time.monotonic() + timeout
+    for site_name, thread in threads.items():
+        thread.join(max(0.0, deadline - time.monotonic()))
+        if thread.is_alive():
+            error_message = f'Проверка {site_name} не уложилась в {timeout}с'
+            logger.error(error_message)
+            results[site_name] = SiteCheckResult(site_name, status='timeout', duration=timeout, error=error_message)
+    return [results[site_name] for site_name in checks]
+
+
+def start_background_checks(checks: dict[str, Callable[[], None]]) -> None:
+    """Запускает проверки по очереди в одном фоновом потоке и не ждет их. Вызывается после цикла мониторинга,
+    поэтому проверки не отнимают время и лимит запросов у обновления книг. Если фоновые проверки прошлого цикла
+    еще идут, новые не запускаются"""
+    global _background_thread
+    if _background_thread is not None and _background_thread.is_alive():
+        logger.debug('Фоновые проверки прошлого цикла еще не завершились, пропускаем')
+        return
+    _background_thread = threading.Thread(target=_run_background_checks, args=(checks,), name='monitoring-background', daemon=True)
+    _background_thread.start()
+
+
+def _run_background_checks(checks: dict[str, Callable[[], None]]) -> None:
+    for site_name, check in checks.items():
+        result = SiteCheckResult(site_name)
+        _run_site_check(site_name, check, result)
+        logger.debug(f'Фоновая проверка {format_check_results([result])}')
+
+
+def format_check_results(results: list[SiteCheckResult]) -> str:
+    lines = [f'{result.site_name}: {result.status} ({result.duration:.0f}с) {result.error}'.strip() for result in results]
+    return '\n'.join(lines)
@@ -0,0 +1,141 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import dotenv
+import urllib3
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+# сколько секунд после первого сообщения ждать следующие, чтобы отправить их одним сообщением
+BATCH_DELAY = 2.0
+MAX_SEND_ATTEMPTS = 5
+FLUSH_TIMEOUT = 30.0
+CHAT_ID_VARIABLES = {'book_chat': 'TELEGRAM_BOOK_CHAT_ID',
+                     'youtube_chat': 'TELEGRAM_YOUTUBE_CHAT_ID',
+                     'common': 'TELEGRAM_COMMON_CHAT_ID'}
+
+_STOP = None
+
+
+class TelegramNotifier:
+    """Очередь сообщений в telegram с отправкой в фоновом потоке: вызывающий код никогда не ждет сеть.
+    Сообщения, пришедшие подряд, склеиваются по каналам в одно сообщение не длиннее лимита telegram"""
+
+    def __init__(self) -> None:
+        self._queue: queue.Queue[tuple[str, str] | None] = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._thread_lock = threading.Lock()
+        self._http = urllib3.PoolManager()
+        dotenv.load_dotenv()
+        self._token = os.getenv('TELEGRAM_BOT_TOKEN')
+        self._chat_ids = {channel_name: os.getenv(variable) for channel_name, variable in CHAT_ID_VARIABLES.items()}
+
+    def send(self, channel_name: str, text: str) -> None:
+        self._start_worker()
+        self._queue.put((channel_name, text))
+
+    def flush(self, timeout: float = FLUSH_TIMEOUT) -> None:
+        """Отправляет все сообщения из очереди и останавливает поток, вызывается при выходе из программы"""
+        with self._thread_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _start_worker(self) -> None:
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='telegram-notifier', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        stopped = False
+        while not stopped:
+            messages = [self._queue.get()]
+            deadline = time.monotonic() + BATCH_DELAY
+            while messages[-1] is not _STOP and (wait_time := deadline - time.monotonic()) > 0:
+                try:
+                    messages.append(self._queue.get(timeout=wait_time))
+                except queue.Empty:
+                    break
+            stopped = messages[-1] is _STOP
+            self._send_batch([message for message in messages if message is not _STOP])
+
+    def _send_batch(self, messages: list[tuple[str, str]]) -> None:
+        texts_by_channel: dict[str, list[str]] = {}
+        for channel_name, text in messages:
+            texts_by_channel.setdefault(channel_name, []).append(text)
+        for channel_name, texts in texts_by_channel.items():
+            for text in _split_batch(texts):
+                self._send_message(channel_name, text)
+
+    def _send_message(self, channel_name: str, text: str) -> None:
+        chat_id = self._chat_ids.get(channel_name)
+        if not self._token or not chat_id:
+            logger.warning(f'Не заданы токен или чат telegram для {channel_name}, сообщение не отправлено')
+            return
+        url = f'https://api.telegram.org/bot{self._token}/sendMessage'
+        for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+            try:
+                response = self._http.request(method='POST', url=url, fields={'chat_id': chat_id, 'text': text})
+            except urllib3.exceptions.HTTPError:
+                logger.warning(f'Ошибка соединения с telegram, попытка {attempt}')
+                time.sleep(attempt)
+                continue
+            if response.status == 200:
+                return
+            if response.status == 429:
+                retry_after = _get_retry_after(response.data)
+                logger.warning(f'Лимит сообщений telegram, ждем {retry_after}с')
+                time.sleep(retry_after)
+                continue
+            logger.warning(f'Telegram не принял сообщение: {response.status} {response.data[:200]!r}')
+            return
+        logger.warning(f'Не удалось отправить сообщение в telegram {channel_name} за {MAX_SEND_ATTEMPTS} попыток')
+
+
+def _get_retry_after(response_data: bytes) -> float:
+    try:
+        return float(json.loads(response_data)['parameters']['retry_after'])
+    except (ValueError, KeyError, TypeError):
+        return 5.0
+
+
+def _split_batch(texts: list[str]) -> list[str]:
+    """Склеивает сообщения в куски не длиннее TELEGRAM_MESSAGE_LIMIT, слишком длинное сообщение режется"""
+    batch_texts: list[str] = []
+    current_text = ''
+    for text in texts:
+        for start in range(0, max(len(text), 1), TELEGRAM_MESSAGE_LIMIT):
+            text_part = text[start:start + TELEGRAM_MESSAGE_LIMIT]
+            if current_text and len(current_text) + 2 + len(text_part) > TELEGRAM_MESSAGE_LIMIT:
+                batch_texts.append(current_text)
+                current_text = ''
+            current_text = f'{current_text}\n\n{text_part}' if current_text else text_part
+    if current_text:
+        batch_texts.append(current_text)
+    return batch_texts
+
+
+_notifier: TelegramNotifier | None = None
+_notifier_lock = threading.Lock()
+
+
+def get_notifier() -> TelegramNotifier:
+    global _notifier
+    with _notifier_lock:
+        if _notifier is None:
+            _notifier = TelegramNotifier()
+            atexit.register(_notifier.flush)
+        return _notifier
+
+
+def flush_notifications() -> None:
+    if _notifier is not None:
+        _notifier.flush()
@@ -27,6 +27,8 @@ class ChapterInfo:
     chapter_updated_date: int = field(default=0, compare=False)
     chapter_posted_date: int = field(default=0, compare=False)
     chapter_size: int = field(default=0, compare=False)
+    chapter_word_count: int = field(default=0, compare=False)
+    chapter_digest: str = field(default='', compare=False)
 
 
 @dataclass()
@@ -0,0 +1,64 @@
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+from settings.settings import RATE_LIMITS, SITE_ALIASES
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket: rate запросов в секунду в среднем, но не больше burst подряд"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Забирает токен, если токенов нет - ждет. Возвращает время ожидания"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(float(self.burst), self._tokens + (now - self._last_time) * self.rate)
+            self._last_time = now
+            # токен резервируется сразу, даже если уходим в минус, поэтому потоки выстраиваются в очередь
+            self._tokens -= 1
+            wait_time = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
+
+
+_buckets: dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_site_alias(url: str) -> str | None:
+    host = urlparse(url).hostname or ''
+    return SITE_ALIASES.get(host)
+
+
+def _get_bucket(site_alias: str) -> TokenBucket | None:
+    with _buckets_lock:
+        bucket = _buckets.get(site_alias)
+        if bucket is None and site_alias in RATE_LIMITS:
+            rate, burst = RATE_LIMITS[site_alias]
+            bucket = TokenBucket(rate, burst)
+            _buckets[site_alias] = bucket
+        return bucket
+
+
+def wait_for_request_slot(url: str) -> None:
+    """Вызывается перед каждым запросом сессии. Спит только если бюджет запросов к сайту исчерпан"""
+    site_alias = get_site_alias(url)
+    if site_alias is None:
+        return
+    bucket = _get_bucket(site_alias)
+    if bucket is None:
+        return
+    wait_time = bucket.acquire()
+    if wait_time:
+        logger.debug('Лимит запросов %s исчерпан, ждали %.2fс', site_alias, wait_time)
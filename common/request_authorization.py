@@ -1,25 +1,39 @@
+import json
 import logging
 import pickle
+import threading
 import time
 from os import getenv
+from pathlib import Path
+from typing import Any
 
 import bs4
 import cloudscraper
 import dotenv
 import fake_useragent
-from bs4 import BeautifulSoup
-from requests import Session
+from requests import Response, Session
 from requests.adapters import HTTPAdapter, Retry
 
 from common.exceptions import GetPageSourseException
 from common.project_types import site_alias_list
+from common.rate_limiter import get_site_alias, wait_for_request_slot
 from common.utils import create_soup
+from settings.settings import AUTH_CHECK_TTL
 
 logger = logging.getLogger(__name__)
 DEFAULT_TIMEOUT = 5  # seconds
+# когда последний раз проверялась авторизация на каждом сайте
+AUTH_STATE_PATH = Path('temp/auth_state.json')
+# css-селекторы элементов, которые есть на любой странице сайта только у авторизованного пользователя
+AUTH_MARKERS = {'sol': 'a[title="Private Messages"]',
+                'ficbook': 'img[alt="russarr"]',
+                'aooo': 'a[href="/users/logout"]'}
+
+_auth_state_lock = threading.Lock()
 
 
 # Переопределяем класс HTTPAdapter для возможности выствления timeout по дефолту вместо None, и настройки количества попыток
+# Все запросы через адаптер проходят через общий лимитер запросов к сайту
 class TimeoutHTTPAdapter(HTTPAdapter):
     def __init__(self, *args, **kwargs):  # type: ignore
         self.timeout = DEFAULT_TIMEOUT
@@ -32,6 +46,7 @@ class TimeoutHTTPAdapter(HTTPAdapter):
         timeout = kwargs.get("timeout")
         if timeout is None:
             kwargs["timeout"] = self.timeout
+        wait_for_request_slot(request.url)
         return super().send(request, **kwargs)
 
 
@@ -53,6 +68,15 @@ def create_auth_session(site_alias: site_alias_list = None) -> Session:
 
     logger.debug('авторизуемся')
     session = _load_cookiejar(session, site_alias=site_alias)
+    if session.cookies and _is_auth_verified_recently(site_alias):
+        logger.debug(f'Авторизация {site_alias} проверялась недавно, не проверяем')
+    else:
+        session = _authorize(session, site_alias)
+    _add_reauth_hook(session, site_alias)
+    return session
+
+
+def _authorize(session: Session, site_alias: site_alias_list) -> Session:
     n = 5
     while not _is_authorized(session, site_alias):
         session = _post_auth_data(session, site_alias)
@@ -63,9 +87,87 @@ def create_auth_session(site_alias: site_alias_list = None) -> Session:
             logger.error(error_message)
             raise GetPageSourseException(error_message)
     _save_cookiejar(session, site_alias=site_alias)
+    _save_auth_verified_time(site_alias, time.time())
     return session
 
 
+def _add_reauth_hook(session: Session, site_alias: site_alias_list) -> None:
+    """Проверка авторизации по ответам обычных запросов: если cookie протухли и сайт отдал страницу без признака
+    авторизации, авторизуемся заново и повторяем запрос. Пока повтор не вернул страницу с признаком авторизации,
+    заново не авторизуемся, чтобы не зациклиться на сломанном логине"""
+    reauth_lock = threading.Lock()
+    reauth_state: dict[str, Any] = {'done': False, 'thread': None}
+
+    def reauth_hook(response: Response, *args: Any, **kwargs: Any) -> Response | None:
+        # запросы самой авторизации не проверяем
+        if reauth_state['thread'] == threading.get_ident() or _check_auth_marker(response, site_alias) is not False:
+            return None
+        with reauth_lock:
+            if reauth_state['done']:
+                return None
+            reauth_state['done'], reauth_state['thread'] = True, threading.get_ident()
+            logger.info(f'Сайт {site_alias} вернул страницу без авторизации, авторизуемся заново')
+            try:
+                _save_auth_verified_time(site_alias, None)
+                authorized_session = _authorize(session, site_alias)
+                if authorized_session is not session:
+                    session.cookies.update(authorized_session.cookies)
+            finally:
+                reauth_state['thread'] = None
+        request_url = response.history[0].request.url if response.history else response.request.url
+        retry_response = session.get(request_url, timeout=kwargs.get('timeout'))
+        if _check_auth_marker(retry_response, site_alias):
+            # авторизация снова работает, следующее истечение cookie тоже обработаем
+            reauth_state['done'] = False
+        return retry_response
+
+    session.hooks['response'].append(reauth_hook)
+
+
+def _check_auth_marker(response: Response, site_alias: site_alias_list) -> bool | None:
+    """Есть ли на странице признак авторизации. None - по ответу этого не определить: не GET, не html-страница
+    самого сайта или фрагмент страницы"""
+    if response.request.method != 'GET' or response.status_code != 200 or get_site_alias(response.url) != site_alias:
+        return None
+    if 'text/html' not in response.headers.get('Content-Type', ''):
+        return None
+    page_source = response.text
+    # фрагменты страниц (без <head>) шапку сайта не содержат, по ним авторизацию не определить
+    if '<head' not in page_source:
+        return None
+    return _has_auth_marker(page_source, site_alias)
+
+
+def _has_auth_marker(page_source: str, site_alias: site_alias_list) -> bool:
+    return create_soup(page_source).select_one(AUTH_MARKERS[site_alias]) is not None
+
+
+def _is_auth_verified_recently(site_alias: site_alias_list) -> bool:
+    verified_time = _load_auth_state().get(str(site_alias))
+    return verified_time is not None and time.time() - verified_time < AUTH_CHECK_TTL
+
+
+def _load_auth_state() -> dict[str, float]:
+    try:
+        auth_state: dict[str, float] = json.loads(AUTH_STATE_PATH.read_text(encoding='utf-8'))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return auth_state
+
+
+def _save_auth_verified_time(site_alias: site_alias_list, verified_time: float | None) -> None:
+    with _auth_state_lock:
+        auth_state = _load_auth_state()
+        if verified_time is None:
+            auth_state.pop(str(site_alias), None)
+        else:
+            auth_state[str(site_alias)] = verified_time
+        try:
+            AUTH_STATE_PATH.write_text(json.dumps(auth_state), encoding='utf-8')
+        except OSError:
+            logger.exception(f'Не могу сохранить время проверки авторизации {site_alias}')
+
+
 def create_request_session() -> Session:
     logger.debug('Создаем сессию')
     user = fake_useragent.UserAgent().random
@@ -103,23 +205,18 @@ def _is_authorized(session: Session, site_alias: site_alias_list) -> bool:
     match site_alias:
         case 'sol':
             response = session.get('https://storiesonline.net')
-            soup = BeautifulSoup(response.text, 'html5lib')
-            test_auth = soup.find('a', title="Private Messages")
         case 'ficbook':
             response = session.get('https://ficbook.net')
-            soup = BeautifulSoup(response.text, 'html5lib')
-            test_auth = soup.find('img', alt="russarr")
         case 'aooo':
             response = session.get('https://archiveofourown.org/')
-            soup = BeautifulSoup(response.text, 'html5lib')
-            test_auth = soup.find('a', href="/users/logout")
         case _:
             error_message = f'Не верный site_alias {site_alias}'
             logger.error(error_message)
             raise GetPageSourseException
+    test_auth = _has_auth_marker(response.text, site_alias)
     if test_auth:
         logger.debug('Есть авторизация')
-    return True if test_auth else False
+    return test_auth
 
 
 def _post_auth_data(session: Session, site_alias: site_alias_list) -> Session:
@@ -168,6 +265,8 @@ def _post_aooo_auth_data(session: Session, auth_data: dict[str, str]) -> Session
 def _post_ficbook_auth_data(auth_data: dict[str, str]) -> Session:
     login_url = 'https://ficbook.net/login_check'
     session = cloudscraper.create_scraper()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
     session.post(login_url, data=auth_data)
     return session
 
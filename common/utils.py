@@ -1,19 +1,24 @@
 import logging
-import os
 import re
 from typing import Callable, Literal
 
-import dotenv
-import fake_useragent
-import requests
-import urllib3
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, FeatureNotFound
 
-from common.exceptions import GetPageSourseException
-from common.project_types import BookInfo
+from common.exceptions import GetPageSourseException, ParsingException
+from common.notifications import CHAT_ID_VARIABLES, get_notifier
+from common.project_types import BookInfo, site_alias_list
 
 logger = logging.getLogger(__name__)
 
+# Парсеры по порядку: lxml быстрый, html5lib медленный, но разбирает любую разметку как браузер
+PARSER_BACKENDS = ('lxml', 'html5lib')
+# Страницы с текстом глав. lxml строит другое дерево, чем html5lib: на кривой авторской разметке (перепутанная
+# вложенность тэгов, таблица внутри <p>) переставляет тэги, выкидывает пробельные отступы и не добавляет <tbody>,
+# и сохраненный текст главы меняется. Для сайтов, где разбор расходится, остается html5lib,
+# сверку по сохраненным страницам делает parser_checks/parser_parity.py
+CHAPTER_PARSER_BACKENDS: dict[site_alias_list, tuple[str, ...]] = {'sf_sb': ('html5lib',),
+                                                                   'sol': ('html5lib',)}
+
 
 def parse_book_url(book_url: str, choose_book_class: dict[str, Callable]) -> tuple[str, str, Callable]:
     """возвращает site_name, book_link, book_class"""
@@ -33,15 +38,26 @@ def parse_book_url(book_url: str, choose_book_class: dict[str, Callable]) -> tup
     return site_name, book_link, choose_book_class[site_name]
 
 
-def request_get_image(image_link: str) -> requests.Response:
-    user = fake_useragent.UserAgent().random
-    header = {'user-agent': user}
-    response = requests.get(image_link, headers=header)
-    return response
-
-
-def create_soup(page_source: str) -> BeautifulSoup:
-    soup = BeautifulSoup(page_source, 'html5lib')
+def create_soup(page_source: str, required_selector: str | None = None,
+                parser_backends: tuple[str, ...] | None = None) -> BeautifulSoup:
+    """Парсит страницу первым доступным парсером из parser_backends, по умолчанию PARSER_BACKENDS. Если в результате
+    нет required_selector (быстрый парсер не справился с кривой разметкой), страница парсится следующим парсером"""
+    if parser_backends is None:
+        parser_backends = PARSER_BACKENDS
+    soup = None
+    for parser in parser_backends:
+        try:
+            soup = BeautifulSoup(page_source, parser)
+        except FeatureNotFound:
+            logger.debug(f'Парсер {parser} не установлен')
+            continue
+        if required_selector is None or soup.select_one(required_selector) is not None:
+            return soup
+        logger.debug(f'Парсер {parser} не нашел {required_selector}, пробуем следующий')
+    if soup is None:
+        error_message = f'Не установлен ни один парсер из {parser_backends}'
+        logger.error(error_message)
+        raise ParsingException(error_message)
     return soup
 
 
@@ -63,28 +79,10 @@ def form_acceptable_name(file_name: str, file_name_length: int) -> str:
 
 
 def send_telegram_message(channel_name: Literal['book_chat', 'youtube_chat', 'common'], text: str) -> None:
-    dotenv.load_dotenv()
-    token = os.getenv('TELEGRAM_BOT_TOKEN')
-    book_chat_id = os.getenv('TELEGRAM_BOOK_CHAT_ID')
-    youtube_chat_id = os.getenv('TELEGRAM_YOUTUBE_CHAT_ID')
-    common_chat_id = os.getenv('TELEGRAM_COMMON_CHAT_ID')
-    match channel_name:
-        case 'book_chat':
-            chat_id = book_chat_id
-        case 'youtube_chat':
-            chat_id = youtube_chat_id
-        case 'common':
-            chat_id = common_chat_id
-        case _:
-            error_message = 'Не указан telegram канал'
-            logger.error(error_message)
-            raise GetPageSourseException(error_message)
-
-
-    url = f'https://api.telegram.org/bot{token}/sendMessage'
-    post_data = {'chat_id': chat_id,
-                 'text': text}
-    http = urllib3.PoolManager()
-    logger.debug(f'{token=}, {chat_id=}, {text=}')
-
-    http.request(method='POST', url=url, fields=post_data)
+    """Ставит сообщение в очередь отправки, сама отправка идет в фоновом потоке"""
+    if channel_name not in CHAT_ID_VARIABLES:
+        error_message = 'Не указан telegram канал'
+        logger.error(error_message)
+        raise GetPageSourseException(error_message)
+    logger.debug(f'{channel_name=}, {text=}')
+    get_notifier().send(channel_name, text)
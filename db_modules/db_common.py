@@ -1,26 +1,43 @@
 import logging
 import sqlite3 as sq
+import threading
 from datetime import datetime
 from pathlib import Path
+from typing import Iterable
 
 from common.exceptions import DataBaseExceptions
 from common.project_types import BookInfo, ChapterInfo, site_alias_list
+from db_modules.db_connection import get_connection
+from db_modules.db_migrations import upgrade_db
 
 logger = logging.getLogger(__name__)
 
 
+DB_PATH = Path('book_database/_books.db')
+_db_file_checked = False
+# первая проверка БД обновляет схему, потоки загрузчиков не должны делать это одновременно
+_db_file_check_lock = threading.Lock()
+
+
 def check_db_file() -> Path:
-    logger.debug('проверяем наличие файла БД')
-    db_path = Path('book_database/_books.db')
-    if not db_path.exists():
-        logger.debug('Отсутствует файл базы данных')
-        raise DataBaseExceptions('Отсутсвует файл базы данных')
-    return db_path
+    """Проверяет наличие файла БД и версию схемы только при первом вызове, дальше файл держит открытое соединение"""
+    global _db_file_checked
+    if _db_file_checked:
+        return DB_PATH
+    with _db_file_check_lock:
+        if not _db_file_checked:
+            logger.debug('проверяем наличие файла БД')
+            if not DB_PATH.exists():
+                logger.debug('Отсутствует файл базы данных')
+                raise DataBaseExceptions('Отсутсвует файл базы данных')
+            upgrade_db(get_connection(DB_PATH))
+            _db_file_checked = True
+    return DB_PATH
 
 
 type_book_table_add = tuple[str, str, str, str, str, str, int, int, int, float, str, int, int, int, str, int, str, str]
 type_author_table_add = tuple[str, str]
-type_chapters_table_add = tuple[tuple[str, str, str, int, int, str, int], ...]
+type_chapters_table_add = tuple[tuple[str, str, str, int, int, str, int, str, int], ...]
 type_tag_table_add = tuple[tuple[str, str], ...]
 type_data_add = tuple[type_book_table_add, type_author_table_add, type_chapters_table_add, type_tag_table_add]
 type_book_table_upd = tuple[str, str, str, int, int, int, float, str, int, int, str, str, str]
@@ -28,91 +45,18 @@ type_data_upd = tuple[type_book_table_upd, type_chapters_table_add, type_tag_tab
 
 
 def create_db() -> None:
+    """Создает БД, если ее нет, и обновляет схему до последней версии. Существующие данные не удаляются"""
     logger.debug('создаем БД')
-    db_path = Path('book_database/_books.db')
+    db_path = DB_PATH
     db_path.parent.mkdir(parents=True, exist_ok=True)
-    with sq.connect(db_path) as books_db:
-        cur = books_db.cursor()
-        cur.execute("""DROP TABLE IF EXISTS books""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS books (
-            book_link TEXT(100) NOT NULL PRIMARY KEY,
-            author_link TEXT(50) NOT NULL DEFAULT '',
-            book_title TEXT(50) NOT NULL DEFAULT '',
-            book_description TEXT(1500),
-            book_genre TEXT(100) DEFAULT '',
-            series_link TEXT(100) DEFAULT '',
-            series_order INTEGER UNSIGNED NULL,
-            book_size INTEGER UNSIGNED,
-            votes_count INTEGER UNSIGNED,
-            book_score REAL(4,2),
-            sex_content TEXT(50) DEFAULT '',
-            posted_date INTEGER NOT NULL DEFAULT 0,
-            updated_date INTEGER NOT NULL DEFAULT 0,
-            download_date INTEGER NOT NULL DEFAULT 0,
-            book_status TEXT(50) DEFAULT '',
-            book_monitor_status INTEGER NOT NULL DEFAULT 0,
-            site_name TEXT(100) NOT NULL DEFAULT '',
-            book_directory TEXT(100) NOT NULL DEFAULT '',
-            FOREIGN KEY (author_link) REFERENCES authors(author_link)
-            ON DELETE CASCADE
-            ON UPDATE CASCADE,
-            FOREIGN KEY (series_link) REFERENCES series(series_link)
-            ON DELETE SET NULL
-            ON UPDATE CASCADE
-            )""")
-
-        cur.execute("""DROP TABLE IF EXISTS authors""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS authors (
-            author_link TEXT(100) NOT NULL PRIMARY KEY,
-            author_name TEXT(50) NULL DEFAULT '',
-            monitor_status INTEGER NOT NULL DEFAULT 0,
-            author_followers INTEGER NULL DEFAULT 0
-            )""")
-
-        cur.execute("""DROP TABLE IF EXISTS chapters""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS chapters (
-            chapter_link TEXT(100) NOT NULL PRIMARY KEY,
-            chapter_name TEXT(100) NOT NULL DEFAULT '',
-            chapter_file_name TEXT(50) NOT NULL DEFAULT '',
-            chapter_posted_date INTEGER NULL DEFAULT 0,
-            chapter_updated_date INTEGER NULL DEFAULT 0,
-            book_link TEXT(100) NOT NULL,
-            chapter_size INTEGER NULL DEFAULT 0,
-            FOREIGN KEY (book_link) REFERENCES books(book_link)
-            ON DELETE CASCADE
-            ON UPDATE CASCADE
-            )""")
-
-        cur.execute("""DROP TABLE IF EXISTS series""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS series (
-            series_link TEXT(100) NOT NULL PRIMARY KEY,
-            series_name TEXT(100) NULL DEFAULT '',
-            series_description TEXT(100) NULL DEFAULT '',
-            author_link TEXT(50) NOT NULL DEFAULT '',
-            FOREIGN KEY (author_link) REFERENCES authors(author_link)
-            ON DELETE SET NULL
-            ON UPDATE CASCADE
-            )""")
-
-        cur.execute("""DROP TABLE IF EXISTS book_tags""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS book_tags (
-            tag TEXT(50) NOT NULL,
-            book_link TEXT(100) NOT NULL,
-            FOREIGN KEY (book_link) REFERENCES books(book_link),
-            CONSTRAINT book_tag UNIQUE (tag,book_link)
-            )""")
-
-        cur.execute("""DROP TABLE IF EXISTS wormstorysearch""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS wormstorysearch (
-            book_url TEXT(150) NOT NULL PRIMARY KEY,
-            book_name TEXT(200) NOT NULL DEFAULT ''
-            )""")
-        logger.info(f'Создана БД: {db_path}')
+    with _db_file_check_lock:
+        upgrade_db(get_connection(db_path))
+    logger.info(f'Создана БД: {db_path}')
 
 
 def check_book_link_in_db(book_link: str) -> bool:
     db_path = check_db_file()
-    with sq.connect(db_path) as books_db:
+    with get_connection(db_path) as books_db:
         cur = books_db.cursor()
         cur.execute("SELECT book_link FROM books WHERE book_link = ? """, (book_link,))
         return True if cur.fetchone() else False
@@ -131,7 +75,7 @@ def get_monitoring_stories_list(site_alias: site_alias_list) -> tuple[tuple[str,
             logger.error(error_message)
             raise DataBaseExceptions
     db_path = check_db_file()
-    with sq.connect(db_path) as books_db:
+    with get_connection(db_path) as books_db:
         cur = books_db.cursor()
         cur.execute("""SELECT book_link, site_name
             FROM books
@@ -144,7 +88,7 @@ def get_monitoring_stories_list(site_alias: site_alias_list) -> tuple[tuple[str,
 
 def get_sol_monitoring_authors_list() -> tuple[str, ...]:
     db_path = check_db_file()
-    with sq.connect(db_path) as books_db:
+    with get_connection(db_path) as books_db:
         cur = books_db.cursor()
         cur.execute("""SELECT authors.author_link FROM authors 
         JOIN books ON authors.author_link = books.author_link
@@ -153,6 +97,100 @@ def get_sol_monitoring_authors_list() -> tuple[str, ...]:
     return monitoring_book_list
 
 
+def get_books_list(site_names: Iterable[str]) -> tuple[tuple[str, str], ...]:
+    """Все книги указанных сайтов: (book_link, site_name)"""
+    site_names = tuple(site_names)
+    db_path = check_db_file()
+    with get_connection(db_path) as books_db:
+        cur = books_db.cursor()
+        cur.execute(f"""SELECT book_link, site_name
+            FROM books
+            WHERE site_name IN ({','.join('?' * len(site_names))})""", site_names)
+        books_list = tuple((book[0], book[1]) for book in cur.fetchall() if book)
+    return books_list
+
+
+def get_epub_build_digest(book_link: str) -> str:
+    db_path = check_db_file()
+    with get_connection(db_path) as books_db:
+        cur = books_db.cursor()
+        cur.execute("""SELECT inputs_digest FROM epub_builds WHERE book_link = ?""", (book_link,))
+        build = cur.fetchone()
+    return build[0] if build else ''
+
+
+def save_epub_build_digest(book_link: str, inputs_digest: str) -> None:
+    db_path = check_db_file()
+    with get_connection(db_path) as books_db:
+        try:
+            books_db.execute("""INSERT OR REPLACE INTO epub_builds (book_link, inputs_digest, build_date) VALUES (?,?,?)""",
+                             (book_link, inputs_digest, int(datetime.now().timestamp())))
+        except sq.Error:
+            error_message = f'Проблемы с записью в таблицу epub_builds {book_link}'
+            logger.exception(error_message)
+            raise DataBaseExceptions(error_message)
+
+
+def get_image_file_name(image_link: str) -> str | None:
+    """Имя файла картинки в общем хранилище, если картинка по этой ссылке уже скачивалась"""
+    db_path = check_db_file()
+    with get_connection(db_path) as books_db:
+        cur = books_db.cursor()
+        cur.execute("""SELECT image_file_name FROM images WHERE image_link = ?""", (image_link,))
+        image = cur.fetchone()
+    return image[0] if image else None
+
+
+def save_image_file_name(image_link: str, image_file_name: str) -> None:
+    db_path = check_db_file()
+    with get_connection(db_path) as books_db:
+        try:
+            books_db.execute("""INSERT OR REPLACE INTO images (image_link, image_file_name) VALUES (?,?)""",
+                             (image_link, image_file_name))
+        except sq.Error:
+            error_message = f'Проблемы с записью в таблицу images {image_link}'
+            logger.exception(error_message)
+            raise DataBaseExceptions(error_message)
+
+
+def get_sol_feed_watermark(feed_type: str) -> str | None:
+    """Верхняя ссылка последней просмотренной страницы ленты sol"""
+    db_path = check_db_file()
+    with get_connection(db_path) as books_db:
+        cur = books_db.cursor()
+        cur.execute("""SELECT watermark_link FROM sol_feed_watermarks WHERE feed_type = ?""", (feed_type,))
+        watermark = cur.fetchone()
+    return watermark[0] if watermark else None
+
+
+def get_sol_feed_links(feed_type: str) -> set[str]:
+    db_path = check_db_file()
+    with get_connection(db_path) as books_db:
+        cur = books_db.cursor()
+        cur.execute("""SELECT link FROM sol_feed_links WHERE feed_type = ?""", (feed_type,))
+        feed_links = {link[0] for link in cur.fetchall()}
+    return feed_links
+
+
+def save_sol_feed_links(feed_type: str, links: Iterable[str]) -> None:
+    """Заменяет ссылки просмотренной страницы ленты sol одной транзакцией, первая ссылка становится отметкой ленты"""
+    links = tuple(dict.fromkeys(links))
+    if not links:
+        return
+    db_path = check_db_file()
+    with get_connection(db_path) as books_db:
+        try:
+            books_db.execute("""DELETE FROM sol_feed_links WHERE feed_type = ?""", (feed_type,))
+            books_db.executemany("""INSERT INTO sol_feed_links (feed_type, link) VALUES (?,?)""",
+                                 ((feed_type, link) for link in links))
+            books_db.execute("""INSERT OR REPLACE INTO sol_feed_watermarks (feed_type, watermark_link, checked_date)
+                VALUES (?,?,?)""", (feed_type, links[0], int(datetime.now().timestamp())))
+        except sq.Error:
+            error_message = f'Проблемы с записью просмотренных ссылок ленты sol {feed_type}'
+            logger.exception(error_message)
+            raise DataBaseExceptions(error_message)
+
+
 class BookDBWrite(BookInfo):
     def add_book_to_db(self) -> None:
         """Фукнция добавляет информацию в БД(данные берет из экземпляра класса)"""
@@ -161,13 +199,27 @@ class BookDBWrite(BookInfo):
         data_to_add = self._form_data_add_db()
         self._write_data_to_add(data_to_add, db_path)
 
-    def update_book_in_db(self) -> None:
-        """Фукнция обвновляет информацию в БД(данные берет из экземпляра класса)"""
+    def update_book_in_db(self, chapters: Iterable[ChapterInfo] | None = None) -> None:
+        """Фукнция обвновляет информацию в БД(данные берет из экземпляра класса).
+        chapters - главы, которые нужно перезаписать, по умолчанию все главы книги"""
         logger.debug('Обновляем книгу в БД')
         db_path = check_db_file()
-        data_to_upd = self._form_data_to_upd()
+        data_to_upd = self._form_data_to_upd(chapters)
         self._write_data_to_upd(data_to_upd, db_path)
 
+    def delete_chapters_from_db(self, chapters: Iterable[ChapterInfo]) -> None:
+        """Удаляет из БД главы, которых больше нет на сайте"""
+        data_chapters = tuple((chapter.chapter_link,) for chapter in chapters)
+        logger.debug(f'Удаляем из БД главы {data_chapters}')
+        db_path = check_db_file()
+        with get_connection(db_path) as books_db:
+            try:
+                books_db.executemany("""DELETE FROM chapters WHERE chapter_link = ?""", data_chapters)
+            except sq.Error:
+                error_message = f'Проблемы удаления глав из таблицы chapters {data_chapters}'
+                logger.exception(error_message)
+                raise DataBaseExceptions(error_message)
+
     def _form_data_add_db(self) -> type_data_add:
         data_book = self._form_data_book_table_to_add()
         data_author = self._form_data_author_table_add_db()
@@ -207,14 +259,18 @@ class BookDBWrite(BookInfo):
         data_author = (self.author_link, self.author_name)
         return data_author
 
-    def _form_data_chapters_table_to_add(self) -> type_chapters_table_add:
+    def _form_data_chapters_table_to_add(self, chapters: Iterable[ChapterInfo] | None = None) -> type_chapters_table_add:
+        if chapters is None:
+            chapters = self.chapters_info_list
         data_chapters = tuple((chapter.chapter_link,
                                chapter.chapter_name,
                                chapter.chapter_file_name,
                                chapter.chapter_posted_date,
                                chapter.chapter_updated_date,
                                chapter.book_link,
-                               chapter.chapter_size) for chapter in self.chapters_info_list)
+                               chapter.chapter_size,
+                               chapter.chapter_digest,
+                               chapter.chapter_word_count) for chapter in chapters)
         return data_chapters
 
     def _form_data_tags_table_add_db(self) -> type_tag_table_add:
@@ -223,7 +279,7 @@ class BookDBWrite(BookInfo):
 
     def _write_data_to_add(self, data_to_add: type_data_add, db_path: Path) -> None:
         book_table, authors_table, chapters_table, tags_table = data_to_add
-        with sq.connect(db_path) as books_db:
+        with get_connection(db_path) as books_db:
             cur = books_db.cursor()
             self._write_data_book_table_to_add(cur, book_table)
             self._write_data_author_table_to_add(cur, authors_table)
@@ -292,8 +348,10 @@ class BookDBWrite(BookInfo):
                 chapter_posted_date,
                 chapter_updated_date,
                 book_link,
-                chapter_size
-                ) VALUES(?,?,?,?,?,?,?)""", data_chapters)
+                chapter_size,
+                chapter_digest,
+                chapter_word_count
+                ) VALUES(?,?,?,?,?,?,?,?,?)""", data_chapters)
         except sq.Error:
             error_message = f'Проблемы с записью в таблицу chapters {data_chapters}'
             logger.exception(error_message)
@@ -311,10 +369,10 @@ class BookDBWrite(BookInfo):
             logger.exception(error_message)
             raise DataBaseExceptions(error_message)
 
-    def _form_data_to_upd(self) -> type_data_upd:
+    def _form_data_to_upd(self, chapters: Iterable[ChapterInfo] | None = None) -> type_data_upd:
         logger.debug('Формируем все данные для обновления книги в БД')
         data_book = self._form_data_book_table_to_upd()
-        data_chapters = self._form_data_chapters_table_to_add()
+        data_chapters = self._form_data_chapters_table_to_add(chapters)
         data_tags = self._form_data_tags_table_add_db()
         return data_book, data_chapters, data_tags
 
@@ -340,7 +398,7 @@ class BookDBWrite(BookInfo):
 
     def _write_data_to_upd(self, data_to_upd: type_data_upd, db_path: Path) -> None:
         book_table, chapters_table, tags_table = data_to_upd
-        with sq.connect(db_path) as books_db:
+        with get_connection(db_path) as books_db:
             cur = books_db.cursor()
             # делаем UPDATE только таблицы books, в остальных можно просто перезаписать данные
             self._write_data_book_table_to_upd(cur, book_table)
@@ -373,7 +431,7 @@ class BookDBWrite(BookInfo):
 class BookDBRead(BookInfo):
     def read_book_info_from_db(self) -> None:
         db_path = check_db_file()
-        with sq.connect(db_path) as books_db:
+        with get_connection(db_path) as books_db:
             cur = books_db.cursor()
             self._fetch_book_details(cur, self.book_link)
             self._fetch_book_tags(cur, self.book_link)
@@ -420,7 +478,8 @@ class BookDBRead(BookInfo):
 
     def _fetch_chapters_info_list(self, cur: sq.Cursor, book_link: str) -> None:
         try:
-            cur.execute("""SELECT chapter_name, chapter_file_name, chapter_link, chapter_posted_date, chapter_updated_date, book_link FROM chapters WHERE book_link = ?""", (book_link,))
+            cur.execute("""SELECT chapter_name, chapter_file_name, chapter_link, chapter_posted_date, chapter_updated_date, book_link, chapter_size, chapter_digest,
+             chapter_word_count FROM chapters WHERE book_link = ? ORDER BY chapter_file_name""", (book_link,))
         except sq.Error:
             error_message = f'Ошбика получения информации о глвах из БД по ссылке:{book_link}'
             logger.exception(error_message)
@@ -430,7 +489,8 @@ class BookDBRead(BookInfo):
         if chapters_info_list:
             for chapter in chapters_info_list:
                 chapter_info = ChapterInfo(chapter_name=chapter[0], chapter_file_name=chapter[1], chapter_link=chapter[2],
-                                           chapter_posted_date=chapter[3], chapter_updated_date=chapter[4], book_link=chapter[5])
+                                           chapter_posted_date=chapter[3], chapter_updated_date=chapter[4], book_link=chapter[5],
+                                           chapter_size=chapter[6], chapter_digest=chapter[7], chapter_word_count=chapter[8])
                 self.chapters_info_list.append(chapter_info)
         else:
             error_message = f'Ошибка загрузки информации по главам книги:{book_link}'
@@ -0,0 +1,51 @@
+import logging
+import os
+import sqlite3 as sq
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# WAL позволяет читать во время записи из других потоков, busy_timeout - ждать блокировку, а не падать
+SQLITE_PRAGMAS = ('PRAGMA journal_mode=WAL',
+                  'PRAGMA synchronous=NORMAL',
+                  'PRAGMA temp_store=MEMORY',
+                  'PRAGMA cache_size=-16000',
+                  'PRAGMA busy_timeout=30000')
+# сколько подготовленных запросов sqlite3 держит в кэше соединения
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+
+
+def get_connection(db_path: Path | str) -> sq.Connection:
+    """Постоянное соединение с БД для текущего потока. Соединение sqlite нельзя делить между потоками,
+    поэтому у каждого потока загрузчика свое, но внутри потока оно переиспользуется вместе с кэшем запросов.
+    Использовать как раньше sq.connect: with get_connection(path) as db - коммит или откат транзакции"""
+    connections = _get_thread_connections()
+    connection_key = str(db_path)
+    connection = connections.get(connection_key)
+    if connection is None:
+        logger.debug(f'Открываем соединение с БД {db_path}')
+        connection = sq.connect(db_path, timeout=30, cached_statements=CACHED_STATEMENTS)
+        for pragma in SQLITE_PRAGMAS:
+            connection.execute(pragma)
+        connections[connection_key] = connection
+    return connection
+
+
+def close_connections() -> None:
+    """Закрывает все соединения текущего потока"""
+    connections = _get_thread_connections()
+    for connection in connections.values():
+        connection.close()
+    connections.clear()
+
+
+def _get_thread_connections() -> dict[str, sq.Connection]:
+    # после fork в дочернем процессе соединения родителя использовать нельзя
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.connections = {}
+    connections: dict[str, sq.Connection] = _local.connections
+    return connections
@@ -0,0 +1,167 @@
+import logging
+import sqlite3 as sq
+
+from common.exceptions import DataBaseExceptions
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_V1 = (
+    """CREATE TABLE IF NOT EXISTS books (
+        book_link TEXT(100) NOT NULL PRIMARY KEY,
+        author_link TEXT(50) NOT NULL DEFAULT '',
+        book_title TEXT(50) NOT NULL DEFAULT '',
+        book_description TEXT(1500),
+        book_genre TEXT(100) DEFAULT '',
+        series_link TEXT(100) DEFAULT '',
+        series_order INTEGER UNSIGNED NULL,
+        book_size INTEGER UNSIGNED,
+        votes_count INTEGER UNSIGNED,
+        book_score REAL(4,2),
+        sex_content TEXT(50) DEFAULT '',
+        posted_date INTEGER NOT NULL DEFAULT 0,
+        updated_date INTEGER NOT NULL DEFAULT 0,
+        download_date INTEGER NOT NULL DEFAULT 0,
+        book_status TEXT(50) DEFAULT '',
+        book_monitor_status INTEGER NOT NULL DEFAULT 0,
+        site_name TEXT(100) NOT NULL DEFAULT '',
+        book_directory TEXT(100) NOT NULL DEFAULT '',
+        FOREIGN KEY (author_link) REFERENCES authors(author_link)
+        ON DELETE CASCADE
+        ON UPDATE CASCADE,
+        FOREIGN KEY (series_link) REFERENCES series(series_link)
+        ON DELETE SET NULL
+        ON UPDATE CASCADE
+        )""",
+    """CREATE TABLE IF NOT EXISTS authors (
+        author_link TEXT(100) NOT NULL PRIMARY KEY,
+        author_name TEXT(50) NULL DEFAULT '',
+        monitor_status INTEGER NOT NULL DEFAULT 0,
+        author_followers INTEGER NULL DEFAULT 0
+        )""",
+    """CREATE TABLE IF NOT EXISTS chapters (
+        chapter_link TEXT(100) NOT NULL PRIMARY KEY,
+        chapter_name TEXT(100) NOT NULL DEFAULT '',
+        chapter_file_name TEXT(50) NOT NULL DEFAULT '',
+        chapter_posted_date INTEGER NULL DEFAULT 0,
+        chapter_updated_date INTEGER NULL DEFAULT 0,
+        book_link TEXT(100) NOT NULL,
+        chapter_size INTEGER NULL DEFAULT 0,
+        FOREIGN KEY (book_link) REFERENCES books(book_link)
+        ON DELETE CASCADE
+        ON UPDATE CASCADE
+        )""",
+    """CREATE TABLE IF NOT EXISTS series (
+        series_link TEXT(100) NOT NULL PRIMARY KEY,
+        series_name TEXT(100) NULL DEFAULT '',
+        series_description TEXT(100) NULL DEFAULT '',
+        author_link TEXT(50) NOT NULL DEFAULT '',
+        FOREIGN KEY (author_link) REFERENCES authors(author_link)
+        ON DELETE SET NULL
+        ON UPDATE CASCADE
+        )""",
+    """CREATE TABLE IF NOT EXISTS book_tags (
+        tag TEXT(50) NOT NULL,
+        book_link TEXT(100) NOT NULL,
+        FOREIGN KEY (book_link) REFERENCES books(book_link),
+        CONSTRAINT book_tag UNIQUE (tag,book_link)
+        )""",
+    """CREATE TABLE IF NOT EXISTS wormstorysearch (
+        book_url TEXT(150) NOT NULL PRIMARY KEY,
+        book_name TEXT(200) NOT NULL DEFAULT ''
+        )""",
+)
+
+# Запросы мониторинга, чтения глав и тэгов книги раньше шли полным сканированием таблиц
+INDEXES_V2 = (
+    """CREATE INDEX IF NOT EXISTS idx_chapters_book_link ON chapters (book_link)""",
+    """CREATE INDEX IF NOT EXISTS idx_book_tags_book_link ON book_tags (book_link)""",
+    # частичный индекс только по книгам на мониторинге, условие совпадает с get_monitoring_stories_list
+    """CREATE INDEX IF NOT EXISTS idx_books_monitoring ON books (site_name)
+    WHERE book_monitor_status = 1 AND book_status != 'Concluded'""",
+    """CREATE INDEX IF NOT EXISTS idx_books_site_name ON books (site_name, author_link)""",
+    """ANALYZE""",
+)
+
+CHAPTER_DIGEST_V3 = (
+    # sha256 текста главы: по нему при обновлении видно, изменилась ли глава на самом деле
+    """ALTER TABLE chapters ADD COLUMN chapter_digest TEXT(64) NOT NULL DEFAULT ''""",
+)
+
+EPUB_BUILDS_V4 = (
+    # хэш входных данных последней сборки epub, чтобы массовая пересборка пропускала неизмененные книги
+    """CREATE TABLE IF NOT EXISTS epub_builds (
+        book_link TEXT(100) NOT NULL PRIMARY KEY,
+        inputs_digest TEXT(64) NOT NULL DEFAULT '',
+        build_date INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (book_link) REFERENCES books(book_link)
+        ON DELETE CASCADE
+        ON UPDATE CASCADE
+        )""",
+)
+
+IMAGES_V5 = (
+    # общее для всех книг хранилище картинок: ссылка -> файл, названный по sha256 содержимого
+    """CREATE TABLE IF NOT EXISTS images (
+        image_link TEXT NOT NULL PRIMARY KEY,
+        image_file_name TEXT(70) NOT NULL
+        )""",
+)
+
+SOL_FEEDS_V6 = (
+    # ссылки с последней просмотренной страницы новых (new) и обновленных (upd) историй sol
+    """CREATE TABLE IF NOT EXISTS sol_feed_links (
+        feed_type TEXT(3) NOT NULL,
+        link TEXT(100) NOT NULL,
+        PRIMARY KEY (feed_type, link)
+        ) WITHOUT ROWID""",
+    # верхняя ссылка последней просмотренной страницы: если она не изменилась, новых записей нет
+    """CREATE TABLE IF NOT EXISTS sol_feed_watermarks (
+        feed_type TEXT(3) NOT NULL PRIMARY KEY,
+        watermark_link TEXT(100) NOT NULL,
+        checked_date INTEGER NOT NULL DEFAULT 0
+        )""",
+)
+
+CHAPTER_WORD_COUNT_V7 = (
+    # количество слов в главе хранится рядом с chapter_size, чтобы неизмененные главы не теряли его при обновлении
+    """ALTER TABLE chapters ADD COLUMN chapter_word_count INTEGER NOT NULL DEFAULT 0""",
+)
+
+# версия схемы хранится в PRAGMA user_version, миграции применяются по порядку и только вперед
+MIGRATIONS: tuple[tuple[int, str, tuple[str, ...]], ...] = (
+    (1, 'базовая схема', SCHEMA_V1),
+    (2, 'индексы для глав, тэгов и мониторинга', INDEXES_V2),
+    (3, 'хэш текста главы', CHAPTER_DIGEST_V3),
+    (4, 'сборки epub', EPUB_BUILDS_V4),
+    (5, 'хранилище картинок', IMAGES_V5),
+    (6, 'просмотренные ленты sol', SOL_FEEDS_V6),
+    (7, 'количество слов в главе', CHAPTER_WORD_COUNT_V7),
+)
+
+
+def get_db_version(connection: sq.Connection) -> int:
+    db_version: int = connection.execute("""PRAGMA user_version""").fetchone()[0]
+    return db_version
+
+
+def upgrade_db(connection: sq.Connection) -> None:
+    """Применяет к БД все миграции новее текущей версии. Данные не удаляются, существующий _books.db обновляется на месте.
+    Безопасно при одновременном вызове из нескольких потоков и процессов: каждая миграция берет блокировку записи
+    (BEGIN IMMEDIATE) и заново проверяет версию внутри транзакции, поэтому выполняется только один раз"""
+    if get_db_version(connection) >= MIGRATIONS[-1][0]:
+        return
+    for version, description, statements in MIGRATIONS:
+        try:
+            with connection:
+                connection.execute("""BEGIN IMMEDIATE""")
+                # пока ждали блокировку, миграцию мог выполнить другой поток или процесс
+                if get_db_version(connection) >= version:
+                    continue
+                logger.info(f'Обновляем БД до версии {version}: {description}')
+                for statement in statements:
+                    connection.execute(statement)
+                connection.execute(f"""PRAGMA user_version = {version}""")
+        except sq.Error:
+            error_message = f'Ошибка обновления БД до версии {version}: {description}'
+            logger.exception(error_message)
+            raise DataBaseExceptions(error_message)
@@ -0,0 +1,142 @@
+import logging
+import sqlite3 as sq
+import time
+from pathlib import Path
+from typing import Iterable
+
+from common.exceptions import DataBaseExceptions
+from db_modules.db_connection import get_connection
+
+logger = logging.getLogger(__name__)
+
+YOUTUBE_DB_PATH = Path('book_database/rss_entries.db')
+# сколько последних постов хранится для rss-ленты
+RSS_RECENT_LIMIT = 100
+
+YOUTUBE_TABLES = (
+    """CREATE TABLE IF NOT EXISTS rss_all (
+        rss_entry TEXT NOT NULL
+        )""",
+    # индекс не уникальный: в старых БД в rss_all могут быть повторы
+    """CREATE INDEX IF NOT EXISTS rss_all_rss_entry_index ON rss_all (rss_entry)""",
+    # последние посты для rss-ленты, новые с большим recent_id
+    """CREATE TABLE IF NOT EXISTS rss_recent (
+        recent_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        rss_entry_xml TEXT NOT NULL
+        )""",
+    """CREATE TABLE IF NOT EXISTS youtube_subscriptions (
+        channel_id TEXT NOT NULL PRIMARY KEY
+        )""",
+    # одна строка: сколько подписок было при последнем обновлении списка и когда его обновляли
+    """CREATE TABLE IF NOT EXISTS youtube_subscriptions_state (
+        state_id INTEGER NOT NULL PRIMARY KEY CHECK (state_id = 1),
+        total_results INTEGER NOT NULL DEFAULT 0,
+        refreshed_date INTEGER NOT NULL DEFAULT 0
+        )""",
+)
+
+_youtube_db_checked = False
+
+
+def check_youtube_db() -> Path:
+    """Создает таблицы youtube при первом обращении к БД"""
+    global _youtube_db_checked
+    if not _youtube_db_checked:
+        YOUTUBE_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with get_connection(YOUTUBE_DB_PATH) as rss_db:
+                for statement in YOUTUBE_TABLES:
+                    rss_db.execute(statement)
+        except sq.Error:
+            error_message = f'Ошибка создания таблиц youtube в {YOUTUBE_DB_PATH}'
+            logger.exception(error_message)
+            raise DataBaseExceptions(error_message)
+        _youtube_db_checked = True
+    return YOUTUBE_DB_PATH
+
+
+def read_youtube_subscriptions() -> tuple[list[str], int, int]:
+    """Сохраненный список id каналов, количество подписок и время обновления списка"""
+    db_path = check_youtube_db()
+    with get_connection(db_path) as rss_db:
+        channel_ids = [row[0] for row in rss_db.execute("""SELECT channel_id FROM youtube_subscriptions""")]
+        state = rss_db.execute("""SELECT total_results, refreshed_date FROM youtube_subscriptions_state""").fetchone()
+    total_results, refreshed_date = state if state else (0, 0)
+    return channel_ids, total_results, refreshed_date
+
+
+def write_youtube_subscriptions(channel_ids: Iterable[str], total_results: int) -> None:
+    """Заменяет сохраненный список подписок одной транзакцией"""
+    db_path = check_youtube_db()
+    try:
+        with get_connection(db_path) as rss_db:
+            rss_db.execute("""DELETE FROM youtube_subscriptions""")
+            rss_db.executemany("""INSERT OR IGNORE INTO youtube_subscriptions (channel_id) VALUES (?)""",
+                               ((channel_id,) for channel_id in channel_ids))
+            rss_db.execute("""INSERT OR REPLACE INTO youtube_subscriptions_state (state_id, total_results, refreshed_date)
+                VALUES (1, ?, ?)""", (total_results, int(time.time())))
+    except sq.Error:
+        error_message = 'Ошибка записи списка подписок youtube'
+        logger.exception(error_message)
+        raise DataBaseExceptions(error_message)
+
+
+def filter_new_rss_links(video_links: Iterable[str]) -> set[str]:
+    """Ссылки на видео, которых еще нет в rss_all. Вся пачка проверяется одним запросом через временную таблицу"""
+    db_path = check_youtube_db()
+    try:
+        with get_connection(db_path) as rss_db:
+            rss_db.execute("""CREATE TEMP TABLE IF NOT EXISTS rss_batch (rss_entry TEXT NOT NULL PRIMARY KEY)""")
+            rss_db.execute("""DELETE FROM rss_batch""")
+            rss_db.executemany("""INSERT OR IGNORE INTO rss_batch (rss_entry) VALUES (?)""",
+                               ((video_link,) for video_link in video_links))
+            new_links = {row[0] for row in rss_db.execute(
+                """SELECT rss_entry FROM rss_batch
+                WHERE NOT EXISTS (SELECT 1 FROM rss_all WHERE rss_all.rss_entry = rss_batch.rss_entry)""")}
+            rss_db.execute("""DELETE FROM rss_batch""")
+    except sq.Error:
+        error_message = 'Ошибка проверки новых постов youtube в БД'
+        logger.exception(error_message)
+        raise DataBaseExceptions(error_message)
+    return new_links
+
+
+def save_rss_entries(rss_entries: list[tuple[str, str]], recent_limit: int = RSS_RECENT_LIMIT) -> None:
+    """Записывает ссылки и xml новых постов одной транзакцией, в rss_recent остается recent_limit последних постов"""
+    if not rss_entries:
+        return
+    db_path = check_youtube_db()
+    try:
+        with get_connection(db_path) as rss_db:
+            rss_db.executemany("""INSERT INTO rss_all (rss_entry) VALUES (?)""",
+                               ((video_link,) for video_link, _ in rss_entries))
+            rss_db.executemany("""INSERT INTO rss_recent (rss_entry_xml) VALUES (?)""",
+                               ((entry_xml,) for _, entry_xml in rss_entries))
+            rss_db.execute("""DELETE FROM rss_recent WHERE recent_id NOT IN
+                (SELECT recent_id FROM rss_recent ORDER BY recent_id DESC LIMIT ?)""", (recent_limit,))
+    except sq.Error:
+        error_message = 'Ошибка записи новых постов youtube в БД'
+        logger.exception(error_message)
+        raise DataBaseExceptions(error_message)
+
+
+def read_recent_rss_entries() -> list[str]:
+    """xml последних постов для rss-ленты, новые первыми"""
+    db_path = check_youtube_db()
+    with get_connection(db_path) as rss_db:
+        return [row[0] for row in rss_db.execute("""SELECT rss_entry_xml FROM rss_recent ORDER BY recent_id DESC""")]
+
+
+def seed_recent_rss_entries(entries_xml: list[str], recent_limit: int = RSS_RECENT_LIMIT) -> None:
+    """Заполняет пустую rss_recent постами из старого pickle-файла, там новые посты шли первыми"""
+    db_path = check_youtube_db()
+    try:
+        with get_connection(db_path) as rss_db:
+            if rss_db.execute("""SELECT 1 FROM rss_recent LIMIT 1""").fetchone() is not None:
+                return
+            rss_db.executemany("""INSERT INTO rss_recent (rss_entry_xml) VALUES (?)""",
+                               ((entry_xml,) for entry_xml in reversed(entries_xml[:recent_limit])))
+    except sq.Error:
+        error_message = 'Ошибка переноса старых постов youtube в БД'
+        logger.exception(error_message)
+        raise DataBaseExceptions(error_message)
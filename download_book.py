@@ -1,19 +1,18 @@
-import logging.config
+import logging
 
 import clipboard
 from requests import Session
 
 from common.exceptions import CompileException, DataBaseExceptions, ParsingException, GetPageSourseException
 from common.utils import parse_book_url
-from settings.settings import LOGGING_CONFIG
+from settings.settings import setup_logging
 from site_parsers.archiveofourown.aooo import AoooBook
 from site_parsers.ficbook.ficbook_book import FicbookBook
 from site_parsers.sfsb.sf_sb_book import SfSbBook
 from site_parsers.sol.sol_book import SolBook
 
-logging.config.dictConfig(LOGGING_CONFIG)
+setup_logging()
 logger = logging.getLogger(__name__)
-logging.captureWarnings(True)
 
 
 def main() -> None:
@@ -1,45 +1,146 @@
+import hashlib
 import logging
+import platform
+import sys
 import zipfile
+import zlib
 from datetime import datetime
+from functools import cache
 from pathlib import Path
+from typing import Iterable, Iterator
 
 from common.exceptions import CompileException
-from common.project_types import BookInfo
+from common.project_types import BookInfo, ChapterInfo
 from common.utils import form_acceptable_name, send_telegram_message
 
 logger = logging.getLogger(__name__)
 
+# служебные файлы, которые меняются при каждом обновлении книги. В архиве они всегда последние
+EPUB_SERVICE_FILES = ('OEBPS/Text/titlepage.html', 'OEBPS/content.opf', 'OEBPS/toc.ncx')
+# все записи кроме mimetype сжимаются, mimetype по спецификации epub лежит первым и без сжатия
+EPUB_COMPRESSION = zipfile.ZIP_DEFLATED
+EPUB_COMPRESS_LEVEL = 6
+# дописывание в epub отрезает записи через внутреннее состояние zipfile.ZipFile: списки записей filelist и NameToInfo,
+# start_dir (смещение, с которого при закрытии пишутся новые записи и central directory) и _didModify (без него
+# central directory при закрытии не перезаписывается). Это не публичный API, поэтому только на проверенных версиях
+# CPython, на остальных epub собирается целиком. После дописывания архив все равно проверяется целиком
+ZIPFILE_CUT_VERSIONS = ((3, 10), (3, 11), (3, 12), (3, 13))
+
 
 class BookEpub(BookInfo):
 
-    def compile_epub_file(self) -> None:
-        """Компилируем и сохраняем книгу в epub"""
+    def compile_epub_file(self, changed_chapters: Iterable[str] | None = None, notify: bool = True) -> None:
+        """Компилируем и сохраняем книгу в epub.
+        changed_chapters - имена файлов глав, скачанных при обновлении книги: если epub уже есть, в него дописываются
+        только новые главы и заново пишутся служебные файлы. Без changed_chapters книга собирается целиком.
+        notify - отправлять ли сообщение в telegram"""
         logger.debug('Компилируем epub-файл')
         file_name = self._create_file_name()
         save_path = Path('C:\\Users\\Necros\\YandexDisk\\books')
         save_path = save_path.joinpath(file_name)
-        chapters_data = self._create_chapters_data()
-        content_file, toc_file = self._create_content_and_toc_data()
-        title_page = self._create_title_page()
-        meta_inf_data = self._create_meta_inf_data()
-        images_files = self._get_images()
         logger.debug('Записываем zip-архив')
         try:
-            with zipfile.ZipFile(save_path, mode='w') as zf:
-                zf.writestr('OEBPS/content.opf', content_file)
-                zf.writestr('OEBPS/toc.ncx', toc_file)
-                zf.writestr('META-INF/container.xml', meta_inf_data)
-                zf.writestr('mimetype', 'application/epub+zip')
-                zf.writestr('OEBPS/Text/titlepage.html', title_page)
-                for chapter in chapters_data:
-                    zf.writestr('OEBPS/Text/' + chapter[0], chapter[1])
-                for image in images_files:
-                    zf.write(image[1], 'OEBPS/Images/' + image[0])
+            if changed_chapters is None or not self._append_to_epub_file(save_path, set(changed_chapters)):
+                self._write_epub_file(save_path)
+            if notify:
                 send_telegram_message('book_chat', f'Сохранена книга {file_name}')
         except OSError as e:
             error_message = f'Ошибка при архивации epub файла: {e}'
             raise CompileException(error_message)
 
+    def get_epub_inputs_digest(self) -> str:
+        """Хэш всего, из чего собирается epub: код сборки, метаданные книги, главы и картинки.
+        Файлы глав и картинок не читаются, берутся их хэши из БД, размеры и время изменения"""
+        inputs_digest = hashlib.sha256(_get_epub_code_digest().encode('utf-8'))
+        book_data = (self.book_title, self.author_name, self.book_description, self.book_genre, self.book_size,
+                     self.book_status, self.book_score, self.book_posted_date, self.book_updated_date, *self.book_tags)
+        inputs_digest.update('\0'.join(str(value) for value in book_data).encode('utf-8'))
+        book_directory = Path(self.book_directory)
+        for chapter in self.chapters_info_list:
+            chapter_stat = book_directory.joinpath('Text', chapter.chapter_file_name).stat()
+            chapter_data = (chapter.chapter_file_name, chapter.chapter_name, chapter.chapter_digest, chapter_stat.st_size, chapter_stat.st_mtime_ns)
+            inputs_digest.update('\0'.join(str(value) for value in chapter_data).encode('utf-8'))
+        for image_name, image_path in self._get_images():
+            image_stat = image_path.stat()
+            inputs_digest.update(f'{image_name}\0{image_stat.st_size}\0{image_stat.st_mtime_ns}'.encode('utf-8'))
+        return inputs_digest.hexdigest()
+
+    def _write_epub_file(self, save_path: Path) -> None:
+        """Полная сборка архива. Служебные файлы пишутся последними, чтобы при обновлении их можно было отрезать"""
+        logger.debug('Собираем epub целиком')
+        with zipfile.ZipFile(save_path, mode='w', compression=EPUB_COMPRESSION, compresslevel=EPUB_COMPRESS_LEVEL) as zf:
+            zf.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+            zf.writestr('META-INF/container.xml', self._create_meta_inf_data())
+            # главы читаются с диска по одной, в памяти не держится вся книга
+            for chapter in self._create_chapters_data():
+                zf.writestr('OEBPS/Text/' + chapter[0], chapter[1])
+            for image in self._get_images():
+                zf.write(image[1], 'OEBPS/Images/' + image[0])
+            self._write_epub_service_files(zf)
+
+    def _append_to_epub_file(self, save_path: Path, changed_chapters: set[str]) -> bool:
+        """Дописывает в существующий epub новые главы и картинки, служебные файлы пишет заново.
+        Возвращает False, если так обновить нельзя (нет архива, старый формат, изменилась уже записанная глава)"""
+        if not save_path.exists():
+            return False
+        if not _is_zipfile_cut_supported():
+            logger.debug('Дописывание в epub не проверено на этой версии python, собираем заново')
+            return False
+        with zipfile.ZipFile(save_path, mode='a', compression=EPUB_COMPRESSION, compresslevel=EPUB_COMPRESS_LEVEL) as zf:
+            archive_tail = zf.infolist()[-len(EPUB_SERVICE_FILES):]
+            if (tuple(info.filename for info in archive_tail) != EPUB_SERVICE_FILES
+                    or archive_tail[0].compress_type != EPUB_COMPRESSION):
+                logger.debug('epub собран в старом формате, собираем заново')
+                return False
+            chapters_to_append = []
+            for chapter in self.chapters_info_list:
+                entry_name = 'OEBPS/Text/' + chapter.chapter_file_name
+                if entry_name not in zf.NameToInfo:
+                    chapters_to_append.append(chapter)
+                elif chapter.chapter_file_name in changed_chapters:
+                    # CRC записи в архиве сравниваем с новой главой, не распаковывая архив
+                    chapter_data = self._create_chapter_data(chapter)
+                    if zlib.crc32(chapter_data.encode('utf-8')) != zf.getinfo(entry_name).CRC:
+                        logger.debug(f'Изменилась уже записанная глава {chapter.chapter_file_name}, собираем заново')
+                        return False
+            images_to_append = [image for image in self._get_images() if 'OEBPS/Images/' + image[0] not in zf.NameToInfo]
+            logger.debug(f'Дописываем в epub {len(chapters_to_append)} глав и {len(images_to_append)} картинок')
+            self._cut_epub_service_files(zf)
+            for chapter in chapters_to_append:
+                zf.writestr('OEBPS/Text/' + chapter.chapter_file_name, self._create_chapter_data(chapter))
+            for image in images_to_append:
+                zf.write(image[1], 'OEBPS/Images/' + image[0])
+            self._write_epub_service_files(zf)
+            expected_entries = [(info.filename, info.CRC) for info in zf.infolist()]
+        # если zipfile записал архив не так: central directory не совпадает с записанными записями
+        # или CRC какой-то записи не сходится с ее данными, собираем заново
+        try:
+            with zipfile.ZipFile(save_path) as zf:
+                is_archive_valid = ([(info.filename, info.CRC) for info in zf.infolist()] == expected_entries
+                                    and zf.testzip() is None)
+        except (zipfile.BadZipFile, zlib.error, EOFError):
+            is_archive_valid = False
+        if not is_archive_valid:
+            logger.error(f'После дописывания архив {save_path} поврежден, собираем заново')
+        return is_archive_valid
+
+    @staticmethod
+    def _cut_epub_service_files(zf: zipfile.ZipFile) -> None:
+        """Отрезает служебные файлы в конце архива: следующие записи лягут на их место, а central directory
+        и обрезка хвоста файла выполнятся при закрытии архива. Удалять записи zipfile не умеет, поэтому правим его список записей"""
+        service_files_info = zf.infolist()[-len(EPUB_SERVICE_FILES):]
+        for info in service_files_info:
+            zf.filelist.remove(info)
+            del zf.NameToInfo[info.filename]
+        zf.start_dir = service_files_info[0].header_offset
+        zf._didModify = True
+
+    def _write_epub_service_files(self, zf: zipfile.ZipFile) -> None:
+        content_file, toc_file = self._create_content_and_toc_data()
+        service_files_data = (self._create_title_page(), content_file, toc_file)
+        for entry_name, data in zip(EPUB_SERVICE_FILES, service_files_data, strict=True):
+            zf.writestr(entry_name, data)
+
     def _create_file_name(self) -> str:
         file_name = self.author_name + ' - ' + self.book_title
         file_name = form_acceptable_name(file_name, file_name_length=75)
@@ -111,19 +212,18 @@ class BookEpub(BookInfo):
         toc_data = ''.join([toc_start, toc_head, toc_title, nav_map_start, nav_map_data, nav_map_end, toc_end])
         return toc_data
 
-    def _create_chapters_data(self) -> list[tuple[str, str]]:
-        chapters_data = []
+    def _create_chapters_data(self) -> Iterator[tuple[str, str]]:
         for chapter in self.chapters_info_list:
-            chapter_path = Path(self.book_directory)
-            chapter_name = chapter.chapter_file_name
-            chapter_path = chapter_path.joinpath('Text', chapter_name)
-            text = chapter_path.read_text(encoding='utf-8')
-            chapter_header = '<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.1//EN"\n"http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd">\n<html xmlns="http://www.w3.org/1999/xhtml">\n'
-            chapter_title = f'<head><title>{chapter.chapter_name}</title></head>\n'
-            chapter_text = f'<body>\n{text}\n</body>\n</html>\n'
-            chapter_data = ''.join([chapter_header, chapter_title, chapter_text])
-            chapters_data.append((chapter_name, chapter_data))
-        return chapters_data
+            yield chapter.chapter_file_name, self._create_chapter_data(chapter)
+
+    def _create_chapter_data(self, chapter: ChapterInfo) -> str:
+        chapter_path = Path(self.book_directory)
+        chapter_path = chapter_path.joinpath('Text', chapter.chapter_file_name)
+        text = chapter_path.read_text(encoding='utf-8')
+        chapter_header = '<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.1//EN"\n"http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd">\n<html xmlns="http://www.w3.org/1999/xhtml">\n'
+        chapter_title = f'<head><title>{chapter.chapter_name}</title></head>\n'
+        chapter_text = f'<body>\n{text}\n</body>\n</html>\n'
+        return ''.join([chapter_header, chapter_title, chapter_text])
 
     def _create_title_page(self) -> str:
         book_tags = ', '.join(self.book_tags)
@@ -154,3 +254,13 @@ class BookEpub(BookInfo):
         images_files_paths_list = sorted(images_path.glob('*.*'))
         images_list = [(image_path.name, image_path) for image_path in images_files_paths_list]
         return images_list
+
+
+def _is_zipfile_cut_supported() -> bool:
+    return platform.python_implementation() == 'CPython' and sys.version_info[:2] in ZIPFILE_CUT_VERSIONS
+
+
+@cache
+def _get_epub_code_digest() -> str:
+    """Хэш кода сборки epub: после правки шаблонов в этом файле все книги считаются измененными"""
+    return hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
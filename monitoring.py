@@ -1,47 +1,39 @@
-import logging.config
+import logging
 from datetime import datetime
 
 import schedule
 
-from common.exceptions import *
-from settings.settings import LOGGING_CONFIG
+from common.monitoring_runner import format_check_results, run_site_checks, start_background_checks
+from settings.settings import CHAPTER_VERIFY_SAMPLE_SIZE, MONITORING_SITE_TIMEOUT, setup_logging
 from site_parsers.archiveofourown.aooo_monitoring import check_aooo_updates
 from site_parsers.ficbook.ficbook_monitoring import check_ficbook_updates
-from site_parsers.sfsb.sf_sb_monitoring import check_sf_sb_updates
-from site_parsers.sol.sol_monitoring import check_sol_updates
+from site_parsers.sfsb.sf_sb_monitoring import check_sf_sb_updates, verify_sf_sb_monitoring_book
+from site_parsers.sol.sol_monitoring import check_sol_updates, verify_sol_monitoring_book
 from site_parsers.wormstorysearch.wormstorysearch import check_wormstorysearch
 from site_parsers.youtube.youtube import check_youtube_rss
 
-logging.config.dictConfig(LOGGING_CONFIG)
+setup_logging()
 logger = logging.getLogger(__name__)
-logging.captureWarnings(True)
 
 
 def main() -> None:
-    try:
-        print(datetime.now().strftime("%H:%M"))
-        print('Проверяем storiesonline')
-        check_sol_updates()
-        print('-' * 20)
-        print('Проверяем sf_sb')
-        check_sf_sb_updates()
-        print('-' * 20)
-        print('Проверяем wormstorysearch.com')
-        check_wormstorysearch()
-        print('-' * 20)
-        print('проверяем ficbook_com')
-        check_ficbook_updates()
-        print('-' * 20)
-        print('проверяем archiveofourown.org')
-        check_aooo_updates()
-        print('-' * 20)
-        print('Проверяем youtube')
-        check_youtube_rss()
-        print('Конец цикла\n', '*' * 30, '\n')
-    except (GetPageSourseException, DataBaseExceptions, ParsingException, CompileException):
-        logger.exception('Ошибка запланированная')
-    except:
-        logger.exception('Незапланированная ошибка')
+    print(datetime.now().strftime("%H:%M"))
+    print('Проверяем storiesonline, sf_sb, wormstorysearch.com, ficbook_com, archiveofourown.org, youtube')
+    site_checks = {'storiesonline': check_sol_updates,
+                   'sf_sb': check_sf_sb_updates,
+                   'wormstorysearch.com': check_wormstorysearch,
+                   'ficbook_com': check_ficbook_updates,
+                   'archiveofourown.org': check_aooo_updates,
+                   'youtube': check_youtube_rss}
+    results = run_site_checks(site_checks, timeout=MONITORING_SITE_TIMEOUT)
+    summary = format_check_results(results)
+    logger.debug(summary)
+    print(summary)
+    if CHAPTER_VERIFY_SAMPLE_SIZE:
+        # сверка старых глав после обновления книг, по одной книге с сайта за цикл
+        start_background_checks({'storiesonline': verify_sol_monitoring_book,
+                                 'sf_sb': verify_sf_sb_monitoring_book})
+    print('Конец цикла\n', '*' * 30, '\n')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,62 @@
+"""Проверка diff_chapters на небольших оглавлениях: какие главы попадают в какую группу изменений.
+Переименованная на сайте глава не перекачивается, но должна попасть в renamed, чтобы новое название записалось в БД.
+Запуск из корня проекта: python -m parser_checks.chapter_diff_cases"""
+import sys
+
+from common.chapter_diff import ChapterDiff, diff_chapters
+from common.project_types import ChapterInfo
+
+
+def _chapter(number: int, chapter_name: str = '', chapter_updated_date: int = 0, chapter_file_name: str = '') -> ChapterInfo:
+    return ChapterInfo(chapter_link=f'https://example.com/chapter/{number}', chapter_name=chapter_name or f'Глава {number}',
+                       chapter_file_name=chapter_file_name or f'{number:0>4}.xhtml', chapter_updated_date=chapter_updated_date,
+                       book_link='https://example.com/book')
+
+
+def _db_chapters() -> list[ChapterInfo]:
+    chapters = [_chapter(number, chapter_updated_date=100) for number in range(1, 4)]
+    for chapter in chapters:
+        chapter.chapter_size, chapter.chapter_word_count, chapter.chapter_digest = 5, 900, f'digest-{chapter.chapter_file_name}'
+    return chapters
+
+
+def _numbers(chapters: list[ChapterInfo]) -> list[int]:
+    return [int(chapter.chapter_link.rsplit('/', 1)[-1]) for chapter in chapters]
+
+
+# название случая -> (оглавление на сайте, {группа ChapterDiff: номера глав}), пустые группы не указываются
+DIFF_CASES: dict[str, tuple[list[ChapterInfo], dict[str, list[int]]]] = {
+    'без изменений': ([_chapter(1), _chapter(2), _chapter(3)], {}),
+    'новая глава': ([_chapter(1), _chapter(2), _chapter(3), _chapter(4)], {'new': [4]}),
+    'удаленная глава': ([_chapter(1), _chapter(3, chapter_file_name='0002.xhtml')], {'removed': [2], 'reordered': [3]}),
+    'новая дата': ([_chapter(1), _chapter(2, chapter_updated_date=200), _chapter(3)], {'date_changed': [2]}),
+    'переименованная глава': ([_chapter(1), _chapter(2, chapter_name='Интерлюдия'), _chapter(3)], {'renamed': [2]}),
+    'переименованная глава с новой датой': ([_chapter(1), _chapter(2, 'Интерлюдия', 200), _chapter(3)],
+                                            {'date_changed': [2], 'renamed': [2]}),
+}
+DIFF_GROUPS = ('new', 'removed', 'reordered', 'date_changed', 'renamed')
+
+
+def check_case(case_name: str, site_chapters: list[ChapterInfo], expected_groups: dict[str, list[int]]) -> bool:
+    chapter_diff: ChapterDiff = diff_chapters(_db_chapters(), site_chapters)
+    errors = [f'{group}: {_numbers(getattr(chapter_diff, group))}, ожидалось {expected_groups.get(group, [])}'
+              for group in DIFF_GROUPS if _numbers(getattr(chapter_diff, group)) != expected_groups.get(group, [])]
+    if bool(chapter_diff) != bool(expected_groups):
+        errors.append(f'bool(diff) = {bool(chapter_diff)}')
+    # данные, которых нет в оглавлении, переносятся из БД и для переименованных глав
+    errors += [f'глава {_numbers([chapter])[0]}: не перенесены данные из БД' for chapter in site_chapters
+               if chapter not in chapter_diff.new and chapter.chapter_word_count != 900]
+    print(f'{case_name}: {chapter_diff}')
+    for error in errors:
+        print(f'{case_name}: ОШИБКА, {error}')
+    return not errors
+
+
+def main() -> None:
+    results = [check_case(case_name, site_chapters, expected_groups)
+               for case_name, (site_chapters, expected_groups) in DIFF_CASES.items()]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Сколько раз разбирается html на одну скачанную главу и что сохраняется на диск.
+Каждая скачанная страница должна разбираться один раз: страница темы sf/sb - один раз на все threadmark на ней,
+глава sol - один раз плюс один раз скрытая часть главы, если глава под защитой от ботов.
+Сохраненный текст глав сверяется с parser_checks/pages/<сайт>/expected: глава sol сохраняется тэгом <article>
+без обертки <html><body>, которую давал повторный разбор article.
+Запуск из корня проекта: python -m parser_checks.chapter_parse_count [--update-expected]"""
+import sys
+from typing import Any
+from unittest import mock
+
+from bs4 import BeautifulSoup
+
+from parser_checks.saved_pages import check_expected, extract_sf_sb_chapters, extract_sol_chapters, run_extractor
+
+# сайт -> (глав, скачанных документов): sf/sb - две главы на одной странице темы,
+# sol - короткая глава и глава с защитой, у которой скрытая часть приходит отдельным ответом
+EXPECTED_DOCUMENTS = {'sf_sb': (2, 1),
+                      'sol': (2, 3)}
+CHAPTER_EXTRACTORS = {'sf_sb': extract_sf_sb_chapters,
+                      'sol': extract_sol_chapters}
+
+
+def count_parses(site_alias: str) -> tuple[int, dict[str, str]]:
+    parse_count = 0
+    original_init = BeautifulSoup.__init__
+
+    def counting_init(self: BeautifulSoup, *args: Any, **kwargs: Any) -> None:
+        nonlocal parse_count
+        parse_count += 1
+        original_init(self, *args, **kwargs)
+
+    with mock.patch.object(BeautifulSoup, '__init__', counting_init):
+        saved_chapters = run_extractor(CHAPTER_EXTRACTORS[site_alias])
+    return parse_count, saved_chapters
+
+
+def main() -> None:
+    update_expected = '--update-expected' in sys.argv[1:]
+    results = []
+    for site_alias, (chapters_count, documents_count) in EXPECTED_DOCUMENTS.items():
+        parse_count, saved_chapters = count_parses(site_alias)
+        print(f'{site_alias}: глав {len(saved_chapters)}, скачано документов {documents_count}, разборов html {parse_count}')
+        is_parse_count_ok = len(saved_chapters) == chapters_count and parse_count == documents_count
+        if not is_parse_count_ok:
+            print(f'{site_alias}: ОШИБКА, ожидалось глав {chapters_count} и разборов html {documents_count}')
+        results.append(is_parse_count_ok and check_expected(site_alias, saved_chapters, update_expected))
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
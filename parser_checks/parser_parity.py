@@ -0,0 +1,51 @@
+"""Сверка lxml и html5lib на сохраненных страницах сайтов.
+Для каждого сайта сравнивает, что парсер сайта достает из страниц при разборе lxml и html5lib (html5lib разбирает
+как браузер, на нем проект работал изначально). Если результат расходится, для этого сайта страницы должны
+разбираться html5lib: проверка падает, пока настройки create_soup дают результат, отличный от html5lib.
+Результат с парсерами из настроек сверяется с parser_checks/pages/<сайт>/expected: главы, данные книги,
+список глав и проверка авторизации.
+Запуск из корня проекта: python -m parser_checks.parser_parity [--update-expected]"""
+import difflib
+import sys
+
+from common.utils import CHAPTER_PARSER_BACKENDS, PARSER_BACKENDS
+from parser_checks.saved_pages import SITE_EXTRACTORS, check_expected, extract_site
+
+REFERENCE_PARSER = 'html5lib'
+FAST_PARSER = 'lxml'
+
+
+def _diff(expected: dict[str, str], actual: dict[str, str]) -> list[str]:
+    diff_lines = []
+    for key in sorted(expected.keys() | actual.keys()):
+        diff_lines += difflib.unified_diff(expected.get(key, '').splitlines(), actual.get(key, '').splitlines(),
+                                           f'{key} ({REFERENCE_PARSER})', f'{key}', lineterm='')
+    return diff_lines
+
+
+def check_site(site_alias: str, update_expected: bool) -> bool:
+    reference = extract_site(site_alias, REFERENCE_PARSER)
+    fast_diff = _diff(reference, extract_site(site_alias, FAST_PARSER))
+    configured = extract_site(site_alias)
+    configured_diff = _diff(reference, configured)
+    chapter_backends = CHAPTER_PARSER_BACKENDS.get(site_alias, PARSER_BACKENDS)  # type: ignore[call-overload]
+    backends = f'главы {chapter_backends}, остальные страницы {PARSER_BACKENDS}'
+    if not fast_diff:
+        print(f'{site_alias}: {FAST_PARSER} и {REFERENCE_PARSER} совпадают, парсеры {backends}')
+    else:
+        print(f'{site_alias}: {FAST_PARSER} расходится с {REFERENCE_PARSER}, парсеры {backends}')
+        print('\n'.join(fast_diff))
+    if configured_diff:
+        print(f'{site_alias}: ОШИБКА, с парсерами {backends} результат отличается от {REFERENCE_PARSER}')
+        return False
+    return check_expected(site_alias, configured, update_expected)
+
+
+def main() -> None:
+    update_expected = '--update-expected' in sys.argv[1:]
+    results = [check_site(site_alias, update_expected) for site_alias in SITE_EXTRACTORS]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""Прогон сохраненных страниц сайтов через настоящий код парсеров, без сети.
+Страницы лежат в parser_checks/pages/<сайт>, сессия подменяется FakeSession, которая отдает их по ссылке.
+То, что парсер достает из страниц, сверяется с parser_checks/pages/<сайт>/expected"""
+import difflib
+import json
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
+from unittest import mock
+
+from requests.structures import CaseInsensitiveDict
+
+from common import utils
+from common.project_types import ChapterInfo
+from common.request_authorization import _is_authorized
+from site_parsers.archiveofourown.aooo import AoooBook
+from site_parsers.ficbook.ficbook_book import FicbookBook
+from site_parsers.sfsb.sf_sb_book import SfSbBook
+from site_parsers.sol import sol_monitoring
+from site_parsers.sol.sol_book import SolBook
+
+PAGES_DIR = Path(__file__).parent / 'pages'
+
+SF_SB_SITE = 'https://forums.sufficientvelocity.com'
+SF_SB_BOOK_LINK = '/threads/example-quest-worm-original.41234/threadmarks'
+SF_SB_PAGE_LINK = '/threads/example-quest-worm-original.41234/page-3'
+SF_SB_HIDDEN_LINK = '/threads/example-quest-worm-original.41234/threadmarks-load-range?min=2&max=4&category_id=1&thread_id=41234'
+SOL_SITE = 'https://storiesonline.net'
+AOOO_SITE = 'https://archiveofourown.org'
+FICBOOK_SITE = 'https://ficbook.net'
+
+# url -> сохраненная страница, главные страницы сайтов нужны для проверки авторизации
+SAVED_PAGES = {SF_SB_SITE + SF_SB_BOOK_LINK: 'sf_sb/threadmarks.html',
+               SF_SB_SITE + SF_SB_PAGE_LINK: 'sf_sb/thread_page.html',
+               SOL_SITE: 'sol/home.html',
+               SOL_SITE + '/s/12345/example-story': 'sol/book_index.html',
+               SOL_SITE + '/s/12345:1/example-story': 'sol/chapter_short.html',
+               SOL_SITE + '/s/12345:2/example-story': 'sol/chapter_protected.html',
+               SOL_SITE + '/library/updated_stories.php': 'sol/updated_stories.html',
+               AOOO_SITE + '/': 'aooo/home.html',
+               AOOO_SITE + '/works/4242': 'aooo/work.html',
+               AOOO_SITE + '/works/4242/navigate': 'aooo/navigate.html',
+               FICBOOK_SITE: 'ficbook/home.html',
+               FICBOOK_SITE + '/readfic/123': 'ficbook/book.html'}
+# url -> ответы на POST по порядку: tl.php sol отдает сначала токен, потом скрытую часть главы
+SAVED_POST_RESPONSES = {SF_SB_SITE + SF_SB_HIDDEN_LINK: ('sf_sb/threadmarks_hidden.json',),
+                        SOL_SITE + '/res/responders/tl.php': ('0123456789abcdef0123', 'sol/chapter_protected_part2.html'),
+                        SOL_SITE + '/res/responders/moreData.php': ('sol/book_details.html',)}
+
+
+class FakeResponse:
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.status_code = 200
+        self.headers: CaseInsensitiveDict[str] = CaseInsensitiveDict()
+
+    def json(self) -> object:
+        return json.loads(self.text)
+
+
+class FakeSession:
+    def __init__(self) -> None:
+        self._post_responses = {url: list(responses) for url, responses in SAVED_POST_RESPONSES.items()}
+
+    def get(self, url: str, **kwargs: object) -> FakeResponse:
+        return FakeResponse(read_page(SAVED_PAGES[url]))
+
+    def post(self, url: str, **kwargs: object) -> FakeResponse:
+        post_response = self._post_responses[url].pop(0)
+        return FakeResponse(read_page(post_response) if post_response.endswith(('.html', '.json')) else post_response)
+
+
+def read_page(page_name: str) -> str:
+    return PAGES_DIR.joinpath(page_name).read_text(encoding='utf-8')
+
+
+def check_expected(site_alias: str, extracted: dict[str, str], update_expected: bool = False) -> bool:
+    """Сверяет извлеченные данные с файлами parser_checks/pages/<сайт>/expected, update_expected - перезаписать файлы"""
+    expected_dir = PAGES_DIR / site_alias / 'expected'
+    if update_expected:
+        expected_dir.mkdir(exist_ok=True)
+        for name, text in extracted.items():
+            expected_dir.joinpath(name).write_text(text, encoding='utf-8')
+        return True
+    is_same = True
+    for name, text in extracted.items():
+        expected_path = expected_dir / name
+        expected_text = expected_path.read_text(encoding='utf-8') if expected_path.exists() else ''
+        if text != expected_text:
+            is_same = False
+            print(f'{site_alias}: {name} отличается от {expected_path}')
+            print('\n'.join(difflib.unified_diff(expected_text.splitlines(), text.splitlines(),
+                                                 str(expected_path), name, lineterm='')))
+    return is_same
+
+
+@contextmanager
+def use_parser(parser: str | None) -> Iterator[None]:
+    """Все вызовы create_soup разбирают страницы только парсером parser, None - парсеры из настроек"""
+    if parser is None:
+        yield
+        return
+    with mock.patch.object(utils, 'PARSER_BACKENDS', (parser,)), \
+            mock.patch.dict(utils.CHAPTER_PARSER_BACKENDS, {site: (parser,) for site in utils.CHAPTER_PARSER_BACKENDS}):
+        yield
+
+
+def _read_saved_chapters(book_directory: Path) -> dict[str, str]:
+    return {chapter_path.name: chapter_path.read_text(encoding='utf-8')
+            for chapter_path in sorted(book_directory.joinpath('Text').iterdir())}
+
+
+def extract_sf_sb_chapters(book_directory: Path) -> dict[str, str]:
+    """Сохраненный текст глав: два threadmark на одной странице темы"""
+    book = SfSbBook(SF_SB_BOOK_LINK, SF_SB_SITE)
+    book.book_directory = book_directory
+    chapters = [ChapterInfo(chapter_name=f'Chapter {number}', chapter_link=f'{SF_SB_PAGE_LINK}#{post_id}',
+                            chapter_file_name=f'chapter_{str(number).zfill(4)}.html', book_link=SF_SB_BOOK_LINK)
+                for number, post_id in enumerate(('post-9001', 'post-9003'))]
+    book._download_page_chapters(SF_SB_PAGE_LINK, chapters, FakeSession())  # type: ignore[arg-type]
+    return _read_saved_chapters(book_directory)
+
+
+def extract_sf_sb_index(book_directory: Path) -> dict[str, str]:
+    """Данные книги и список глав со страницы threadmarks, скрытые threadmark приходят отдельным json-ответом"""
+    book = SfSbBook(SF_SB_BOOK_LINK, SF_SB_SITE)
+    book._get_book_details(book._get_sf_sb_soup(FakeSession()))  # type: ignore[arg-type]
+    return _book_fields(book, ('book_title', 'author_name', 'author_link', 'book_description', 'book_posted_date',
+                               'book_updated_date', 'book_status', 'chapters_info_list'))
+
+
+def extract_sf_sb(book_directory: Path) -> dict[str, str]:
+    """Текст глав, данные книги и список глав"""
+    return {**extract_sf_sb_chapters(book_directory), **extract_sf_sb_index(book_directory)}
+
+
+def extract_sol_chapters(book_directory: Path) -> dict[str, str]:
+    """Сохраненный текст короткой главы и главы с защитой от ботов"""
+    book = SolBook('/s/12345/example-story')
+    book.book_directory = book_directory
+    session = FakeSession()
+    with mock.patch('site_parsers.sol.sol_requests_soup.time.sleep'):
+        for number in (1, 2):
+            chapter = ChapterInfo(chapter_name=f'Chapter {number}', chapter_link=f'/s/12345:{number}/example-story',
+                                  chapter_file_name=f'chapter_{str(number - 1).zfill(4)}.html', book_link=book.book_link)
+            book._download_chapter(chapter, session)  # type: ignore[arg-type]
+    return _read_saved_chapters(book_directory)
+
+
+def extract_sol(book_directory: Path) -> dict[str, str]:
+    """Текст глав, данные книги со страницы оглавления и деталей, ссылки со страницы обновлений и авторизация"""
+    extracted = extract_sol_chapters(book_directory)
+    session = FakeSession()
+    book = SolBook('/s/12345/example-story')
+    book_soup = book.get_book_soup(session)  # type: ignore[arg-type]
+    book._get_author_title(book_soup)
+    book._get_chapters_links(book_soup)
+    book._get_book_details(session)  # type: ignore[arg-type]
+    extracted.update(_book_fields(book, ('book_title', 'author_name', 'author_link', 'book_description', 'book_sex_content',
+                                         'book_genre', 'book_tags', 'book_size', 'book_votes_count', 'book_score',
+                                         'book_posted_date', 'book_updated_date', 'book_status', 'chapters_info_list')))
+    page_soup = sol_monitoring._get_upd_new_page_soup(session, 'upd')  # type: ignore[arg-type]
+    extracted['feed_links.txt'] = _format_fields({'updated_links': sol_monitoring._get_upd_links_from_soup(page_soup),
+                                                  'new_links': sol_monitoring._get_new_links_from_soup(page_soup)})
+    extracted.update(_auth_fields(session, 'sol'))
+    return extracted
+
+
+def extract_aooo(book_directory: Path) -> dict[str, str]:
+    """Главы archiveofourown приходят готовым epub, с html берутся только данные книги и оглавление"""
+    book = AoooBook('/works/4242')
+    general_info_soup, chapters_info_soup = book.get_book_soup(FakeSession())  # type: ignore[arg-type]
+    book._get_book_details(general_info_soup)
+    book._get_chapters_links(chapters_info_soup)
+    return {**_book_fields(book, ('book_title', 'author_name', 'author_link', 'book_description', 'book_posted_date',
+                                  'book_updated_date', 'book_status', 'book_tags', 'chapters_info_list')),
+            **_auth_fields(FakeSession(), 'aooo')}
+
+
+def extract_ficbook(book_directory: Path) -> dict[str, str]:
+    """Книги ficbook скачиваются готовым epub, с html берутся только данные книги"""
+    book = FicbookBook('/readfic/123')
+    book._get_book_details(book._get_ficbook_soup(FakeSession()))  # type: ignore[arg-type]
+    return {**_book_fields(book, ('book_title', 'author_name', 'author_link', 'book_description', 'book_posted_date',
+                                  'book_updated_date', 'book_status')),
+            **_auth_fields(FakeSession(), 'ficbook')}
+
+
+def _book_fields(book: object, field_names: tuple[str, ...]) -> dict[str, str]:
+    return {'book_info.txt': _format_fields({field_name: getattr(book, field_name) for field_name in field_names})}
+
+
+def _auth_fields(session: FakeSession, site_alias: str) -> dict[str, str]:
+    """Авторизацию проверяет _is_authorized по главной странице сайта"""
+    return {'auth.txt': _format_fields({'is_authorized': _is_authorized(session, site_alias)})}  # type: ignore[arg-type]
+
+
+def _format_fields(fields: dict[str, object]) -> str:
+    # список глав по одной главе в строке, чтобы расхождение парсеров было видно в diff
+    lines = []
+    for name, value in fields.items():
+        if isinstance(value, list):
+            lines += [f'{name}[{number}] = {item!r}' for number, item in enumerate(value)]
+        else:
+            lines.append(f'{name} = {value!r}')
+    return '\n'.join(lines) + '\n'
+
+
+SITE_EXTRACTORS = {'sf_sb': extract_sf_sb,
+                   'sol': extract_sol,
+                   'aooo': extract_aooo,
+                   'ficbook': extract_ficbook}
+
+
+def extract_site(site_alias: str, parser: str | None = None) -> dict[str, str]:
+    """Данные, которые парсер сайта достает из сохраненных страниц, разобранных парсером parser"""
+    return run_extractor(SITE_EXTRACTORS[site_alias], parser)
+
+
+def run_extractor(extractor: Callable[[Path], dict[str, str]], parser: str | None = None) -> dict[str, str]:
+    with tempfile.TemporaryDirectory() as temp_directory, use_parser(parser):
+        book_directory = Path(temp_directory)
+        book_directory.joinpath('Text').mkdir()
+        return extractor(book_directory)
@@ -0,0 +1,63 @@
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Literal
+
+from tqdm import tqdm
+
+from common.exceptions import CompileException, DataBaseExceptions
+from db_modules.db_common import get_books_list, get_epub_build_digest, save_epub_build_digest
+from settings.settings import REBUILD_WORKERS, setup_logging
+from site_parsers.sfsb.sf_sb_book import SfSbBook
+from site_parsers.sol.sol_book import SolBook
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# epub собирается только для этих сайтов, с ficbook и archiveofourown книги скачиваются готовыми
+BOOK_CLASSES = {'https://forums.sufficientvelocity.com': SfSbBook,
+                'https://forums.spacebattles.com': SfSbBook,
+                'https://storiesonline.net': SolBook}
+
+rebuild_status_type = Literal['rebuilt', 'skipped', 'error']
+
+
+def rebuild_book_epub(book_url_data: tuple[str, str]) -> rebuild_status_type:
+    """Собирает epub книги из данных в БД и файлов глав на диске, без скачивания.
+    Книга пропускается, если с прошлой сборки не изменились ни ее данные, ни код сборки"""
+    book_link, site_name = book_url_data
+    book = BOOK_CLASSES[site_name](book_link, site_name)
+    try:
+        book.read_book_info_from_db()
+        inputs_digest = book.get_epub_inputs_digest()
+        if inputs_digest == get_epub_build_digest(book_link):
+            return 'skipped'
+        book.compile_epub_file(notify=False)
+        save_epub_build_digest(book_link, inputs_digest)
+    except (DataBaseExceptions, CompileException, OSError):
+        logger.exception(f'Ошибка пересборки книги {book_link}')
+        return 'error'
+    return 'rebuilt'
+
+
+def main() -> None:
+    books_list = get_books_list(BOOK_CLASSES)
+    logger.debug(f'Пересобираем epub {len(books_list)} книг в {REBUILD_WORKERS} процессов')
+    results: dict[rebuild_status_type, int] = {'rebuilt': 0, 'skipped': 0, 'error': 0}
+    start_time = time.monotonic()
+    # spawn и в linux: каждый процесс заново запускает setup_logging со своим потоком логирования
+    with ProcessPoolExecutor(max_workers=REBUILD_WORKERS, mp_context=multiprocessing.get_context('spawn')) as executor:
+        for status in tqdm(executor.map(rebuild_book_epub, books_list, chunksize=8), total=len(books_list),
+                           desc='Пересборка epub', colour='green'):
+            results[status] += 1
+    duration = time.monotonic() - start_time
+    books_per_second = len(books_list) / duration if duration else 0.0
+    summary = (f'Пересобрано {results["rebuilt"]}, без изменений {results["skipped"]}, ошибок {results["error"]} '
+               f'за {duration:.0f}с ({books_per_second:.1f} книг/с)')
+    logger.info(summary)
+    print(summary)
+
+
+if __name__ == '__main__':
+    main()
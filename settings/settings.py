@@ -1,14 +1,22 @@
+import atexit
+import logging.config
 import os
+import queue
 from logging import Handler, LogRecord
+from logging.handlers import QueueHandler, QueueListener
 
 import dotenv
 
+from common.notifications import flush_notifications
 from common.utils import send_telegram_message
 
 modules = (('__main__', 'DEBUG'),
            ('site_parsers.sol.sol_book', 'INFO'),
            ('site_parsers.sol.sol_requests_soup', 'INFO'),
            ('db_modules.db_common', 'INFO'),
+           ('db_modules.db_connection', 'INFO'),
+           ('db_modules.db_migrations', 'INFO'),
+           ('db_modules.db_youtube', 'INFO'),
            ('epub.epub', 'INFO'),
            ('site_parsers.sol.sol_monitoring', 'INFO'),
            ('site_parsers.sfsb.sf_sb_book', 'INFO'),
@@ -20,9 +28,17 @@ modules = (('__main__', 'DEBUG'),
            ('site_parsers.youtube.youtube', 'INFO'),
            ('common.utils', 'INFO'),
            ('common.common', 'INFO'),
+           ('common.chapter_diff', 'INFO'),
+           ('common.chapter_downloader', 'INFO'),
+           ('common.rate_limiter', 'INFO'),
+           ('common.monitoring_runner', 'INFO'),
+           ('common.http_cache', 'INFO'),
+           ('common.image_store', 'INFO'),
+           ('common.notifications', 'INFO'),
            ('common.request_authorization', 'INFO'),
            ('download_book', 'INFO'),
-           ('monitoring', 'INFO')
+           ('monitoring', 'INFO'),
+           ('rebuild_epubs', 'INFO')
            )
 loggers = {}
 for logger in modules:
@@ -58,6 +74,9 @@ class TelegramBotHandler(Handler):
         self.chat_id = chat_id
 
     def emit(self, record: LogRecord) -> None:
+        # ошибки самой отправки в telegram туда не шлем, иначе они будут порождать друг друга
+        if record.name == 'common.notifications':
+            return
         send_telegram_message(channel_name='common', text=self.format(record))
 
 
@@ -84,9 +103,84 @@ handlers = {
     }
 }
 
+# Максимальное количество одновременных запросов к сайту при скачивании глав.
+# sol не дает качать параллельно (Too many concurrent accesses), а глава под защитой от ботов - это GET и два POST
+# на tl.php подряд на одних куках, поэтому главы sol качаются строго по одной
+HOST_CONCURRENCY_LIMITS = {'https://forums.sufficientvelocity.com': 4,
+                           'https://forums.spacebattles.com': 4,
+                           'https://storiesonline.net': 1,
+                           'https://ficbook.net': 2,
+                           'https://archiveofourown.org': 2}
+DEFAULT_HOST_CONCURRENCY = 2
+
+# К какому site_alias относится хост, для общего лимита запросов
+SITE_ALIASES = {'forums.sufficientvelocity.com': 'sf_sb',
+                'forums.spacebattles.com': 'sf_sb',
+                'storiesonline.net': 'sol',
+                'login.wlpc.com': 'sol',
+                'ficbook.net': 'ficbook',
+                'archiveofourown.org': 'aooo'}
+
+# Лимиты запросов token bucket: (запросов в секунду, сколько запросов можно сделать подряд)
+RATE_LIMITS = {'sf_sb': (1.0, 5),
+               'sol': (0.5, 3),
+               'ficbook': (0.5, 2),
+               'aooo': (0.5, 3)}
+
+# Сколько секунд после успешной проверки авторизации на сайте не проверять ее заново при создании сессии
+AUTH_CHECK_TTL = 6 * 60 * 60
+
+# Сколько картинок главы скачивать одновременно
+IMAGE_FETCH_WORKERS = 4
+
+# Сколько процессов пересобирают epub в rebuild_epubs.py: сборка упирается в сжатие, поэтому столько же, сколько ядер
+REBUILD_WORKERS = os.cpu_count() or 1
+
+# Сколько секунд список подписок youtube из кэша считается актуальным, даже если количество подписок не менялось
+YOUTUBE_SUBSCRIPTIONS_TTL = 24 * 60 * 60
+
+# Сколько секунд ждать проверку одного сайта в цикле мониторинга
+MONITORING_SITE_TIMEOUT = 45 * 60
+
+# Сколько случайных старых глав перекачивать и сверять по хэшу. Проверка идет в фоне после цикла мониторинга,
+# по одной случайной книге с мониторинга каждого сайта за цикл, 0 - проверка выключена
+CHAPTER_VERIFY_SAMPLE_SIZE = 0
+
 LOGGING_CONFIG = {
     'version': 1,
     'formatters': formatters,
     'handlers': handlers,
     'loggers': loggers
 }
+
+
+_log_listener: QueueListener | None = None
+
+
+def setup_logging() -> None:
+    """Настраивает логирование по LOGGING_CONFIG, но обработчики из конфига работают в отдельном потоке:
+    логгеры только кладут запись в очередь, запись в файл и отправка в telegram идут в QueueListener.
+    Текст сообщения QueueHandler собирает еще в вызывающем потоке: аргументы записи (например тэги bs4, которые
+    сразу после лога удаляются из дерева) в поток логирования не передаются"""
+    global _log_listener
+    if _log_listener is not None:
+        return
+    logging.config.dictConfig(LOGGING_CONFIG)
+    log_queue: queue.SimpleQueue[LogRecord] = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    config_handlers: dict[Handler, None] = {}
+    for logger_name in loggers:
+        module_logger = logging.getLogger(logger_name)
+        config_handlers.update(dict.fromkeys(module_logger.handlers))
+        module_logger.handlers = [queue_handler]
+    _log_listener = QueueListener(log_queue, *config_handlers, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_stop_logging)
+    logging.captureWarnings(True)
+
+
+def _stop_logging() -> None:
+    # сначала дописываем очередь логов, потом отправляем накопленные из нее сообщения в telegram
+    if _log_listener is not None:
+        _log_listener.stop()
+    flush_notifications()
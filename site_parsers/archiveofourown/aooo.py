@@ -8,8 +8,10 @@ import bs4
 from bs4 import BeautifulSoup
 from requests import Session
 
+from common.chapter_diff import diff_chapters
 from common.common import Book
 from common.exceptions import ParsingException, GetPageSourseException
+from common.http_cache import cached_get
 from common.project_types import ChapterInfo
 from common.request_authorization import create_auth_session
 from common.utils import create_soup
@@ -64,11 +66,16 @@ class AoooBook(Book, BookDB):
         """Обновление storiesonline книги"""
         logger.debug('Начинаем обновление книги')
         self.read_book_info_from_db()
+        chapters_in_db = self.chapters_info_list
         book_updated_date_in_db = self.book_updated_date
+        self.chapters_info_list = []
         self._get_book_info(session)
         if self.book_updated_date > book_updated_date_in_db:
             logger.debug('Дата обновления книги больше даты обновления в БД')
+            chapter_diff = diff_chapters(chapters_in_db, self.chapters_info_list)
             self.update_book_in_db()
+            if chapter_diff.removed:
+                self.delete_chapters_from_db(chapter_diff.removed)
             self._download_epub(session)
 
     def _download_full_book(self, session: Session | None = None) -> None:
@@ -128,18 +135,18 @@ class AoooBook(Book, BookDB):
     def get_book_soup(self, session: Session) -> tuple[BeautifulSoup, BeautifulSoup]:
         """Функция получет soup для страницы с общей информацией и странцы со списком глав"""
         logger.debug('Получаем page sourse страницы с общей информацией о книге')
-        response = session.get(self.site_name + self.book_link)
+        response = cached_get(session, self.site_name + self.book_link)
         if response.status_code == 200:
-            general_info_soup = create_soup(response.text)
+            general_info_soup = create_soup(response.text, required_selector='.title.heading')
         else:
             error_message = 'Ошибка получения page sourse страницы с общей информацией о книге'
             logger.error(error_message)
             raise GetPageSourseException(error_message)
 
         logger.debug('Получаем page sourse страницы со списком глав')
-        response = session.get(self.site_name + self.book_link + '/navigate')
+        response = cached_get(session, self.site_name + self.book_link + '/navigate')
         if response.status_code == 200:
-            chapters_info_soup = create_soup(response.text)
+            chapters_info_soup = create_soup(response.text, required_selector='ol.chapter.index.group')
         else:
             error_message = 'Ошибка получения page sourse страницы со списком глав'
             logger.error(error_message)
@@ -286,6 +293,7 @@ class AoooBook(Book, BookDB):
         if isinstance(chapters_links_block, bs4.Tag):
             chapters_info_list = chapters_links_block.find_all('li')
             if chapters_info_list:
+                chapter_links = {chapter_info.chapter_link for chapter_info in self.chapters_info_list}
                 for number, chapter_info_tag in enumerate(chapters_info_list):
                     link = chapter_info_tag.find('a')
                     chapter_date_tag = chapter_info_tag.find('span', class_="datetime")
@@ -296,7 +304,8 @@ class AoooBook(Book, BookDB):
                             chapter_file_name=f'chapter_{str(number).zfill(4)}.html',
                             chapter_posted_date=self._get_chapter_date(chapter_date_tag),
                             book_link=self.book_link)
-                        if chapter_info not in self.chapters_info_list:
+                        if chapter_info.chapter_link not in chapter_links:
+                            chapter_links.add(chapter_info.chapter_link)
                             self.chapters_info_list.append(chapter_info)
                     else:
                         error_message = f'Ошибка парсинга информации о главе {chapter_info_tag}'
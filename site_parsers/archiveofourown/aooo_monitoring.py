@@ -1,5 +1,4 @@
 import logging
-import time
 
 from tqdm import tqdm
 
@@ -17,5 +16,4 @@ def check_aooo_updates() -> None:
     for book_url_data in tqdm(monitoring_list, desc='Обход списка монитринга aooo', colour='green'):
         book = AoooBook(*book_url_data)
         book.downoload_book(session)
-        time.sleep(1)
     session.close()
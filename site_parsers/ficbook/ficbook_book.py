@@ -97,7 +97,7 @@ class FicbookBook(Book, BookDB, BookInfo):
     def _get_ficbook_soup(self, session: Session) -> BeautifulSoup:
         logger.debug('Получаем page sourse основной страницы книги')
         response = session.get(self.site_name + self.book_link)
-        page_soup = create_soup(response.text)
+        page_soup = create_soup(response.text, required_selector='h1.mb-10')
         return page_soup
 
     def _get_book_details(self, book_soup: BeautifulSoup) -> None:
@@ -1,17 +1,14 @@
-import logging.config
+import logging
 import re
-import time
 
 from bs4 import BeautifulSoup
 
 from common.exceptions import ParsingException
 from common.request_authorization import create_auth_session
 from common.utils import create_soup
-from settings.settings import LOGGING_CONFIG
 from site_parsers.ficbook.ficbook_book import FicbookBook
 from site_parsers.ficbook.ficbook_book import _extract_book_link_ficbook
 
-logging.config.dictConfig(LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
 
@@ -44,7 +41,6 @@ def check_ficbook_updates() -> None:
             for book_link in updated_books_list:
                 book = FicbookBook(book_link)
                 session = book.downoload_book(session)
-                time.sleep(2)
             logger.debug('Попытка пометить события прочитанными')
             session.post('https://ficbook.net/user_notifications/delete_all', data={"type": "19"})
     session.close()
@@ -1,9 +1,12 @@
 import re
 import time
+from functools import partial
 from typing import Literal
 import bs4
-from common.utils import create_soup
+from common.http_cache import cached_get
+from common.utils import CHAPTER_PARSER_BACKENDS, create_soup
 from db_modules.db_common import BookDB
+from common.chapter_downloader import SharedSession, download_concurrently
 from common.common import Book
 from bs4 import BeautifulSoup
 from requests import Session
@@ -14,6 +17,9 @@ from common.project_types import ChapterInfo, BookInfo
 
 logger = logging.getLogger(__name__)
 
+# сколько threadmark XenForo показывает на одной странице reader
+READER_PAGE_SIZE = 10
+
 
 class SfSbBook(Book, BookDB, BookInfo):
     __slots__ = ("book_link",
@@ -29,12 +35,16 @@ class SfSbBook(Book, BookDB, BookInfo):
                  "book_download_date",
                  "book_description",
                  "book_status",
-                 "book_monitoring_status")
+                 "book_monitoring_status",
+                 "threadmarks_page_source",
+                 "reader_mode_available")
 
     def __init__(self, book_link: str, site_name: Literal['https://forums.sufficientvelocity.com', 'https://forums.spacebattles.com']):
         if not book_link.endswith('/threadmarks'):
             book_link += '/threadmarks'
         super().__init__(book_link, site_name)
+        self.threadmarks_page_source = ''
+        self.reader_mode_available = True
 
     def _get_book_info(self, session: Session) -> None:
         book_soup = self._get_sf_sb_soup(session)
@@ -42,17 +52,111 @@ class SfSbBook(Book, BookDB, BookInfo):
         self._create_book_directories()
 
     def _download_chapter(self, chapter_link: ChapterInfo, session: Session) -> None:
-        chapter_soup = self._get_chapter_soup(chapter_link, session)
-        chapter_text = self._get_chapter_text(chapter_soup)
-        chapter_link.chapter_size = self._get_chapter_size(chapter_text)
-        self._save_chapter_text_on_disk(chapter_text, chapter_link)
+        self._download_page_chapters(self._get_page_link(chapter_link), [chapter_link], session)
+
+    def _download_chapters(self, chapters: list[ChapterInfo], session: Session, desc: str) -> None:
+        """Сначала главы качаются через reader темы, главы, которых там не нашлось, - по страницам темы"""
+        shared_session = SharedSession(session)
+        chapters_left = self._download_chapters_by_reader(chapters, shared_session, desc)
+        if chapters_left:
+            logger.debug('%s глав не нашлось в reader, качаем по страницам темы', len(chapters_left))
+            self._download_chapters_by_pages(chapters_left, shared_session, desc)
+
+    def _download_chapters_by_reader(self, chapters: list[ChapterInfo], shared_session: SharedSession, desc: str) -> list[ChapterInfo]:
+        """В reader подряд идут READER_PAGE_SIZE threadmark, поэтому номер страницы reader считается по позиции главы.
+        Возвращает главы, которых на ожидаемой странице reader не оказалось"""
+        chapters_by_reader_page = self._group_chapters_by_reader_page(chapters)
+        chapters_left: list[ChapterInfo] = []
+        download_concurrently(self.site_name, chapters_by_reader_page.items(),
+                              lambda page: self._run_with_reconnect(partial(self._download_reader_page_chapters, *page, chapters_left), shared_session),
+                              desc + ' (reader)')
+        return sorted(chapters_left, key=lambda chapter: chapter.chapter_file_name)
+
+    def _group_chapters_by_reader_page(self, chapters: list[ChapterInfo]) -> dict[int, list[ChapterInfo]]:
+        threadmark_positions = {chapter.chapter_link: number for number, chapter in enumerate(self.chapters_info_list)}
+        chapters_by_reader_page: dict[int, list[ChapterInfo]] = {}
+        for chapter in chapters:
+            reader_page = threadmark_positions.get(chapter.chapter_link, 0) // READER_PAGE_SIZE + 1
+            chapters_by_reader_page.setdefault(reader_page, []).append(chapter)
+        return chapters_by_reader_page
+
+    def _download_reader_page_chapters(self, reader_page: int, chapters: list[ChapterInfo], chapters_left: list[ChapterInfo], session: Session) -> None:
+        if not self.reader_mode_available:
+            chapters_left.extend(chapters)
+            return
+        reader_link = self.book_link.removesuffix('/threadmarks') + '/reader/' + (f'page-{reader_page}' if reader_page > 1 else '')
+        response = session.get(self.site_name + reader_link)
+        page_soup = create_soup(response.text, required_selector='article[data-content^="post-"]',
+                                parser_backends=CHAPTER_PARSER_BACKENDS['sf_sb']) if response.status_code == 200 else None
+        if page_soup is None or not page_soup.select_one('article[data-content^="post-"]'):
+            logger.debug('reader недоступен %s, response.status_code=%s', reader_link, response.status_code)
+            self.reader_mode_available = False
+            chapters_left.extend(chapters)
+            return
+        for chapter in chapters:
+            if page_soup.find('article', {'data-content': self._get_post_id(chapter)}):
+                self._save_page_chapter(page_soup, chapter)
+            else:
+                chapters_left.append(chapter)
+
+    def _download_chapters_by_pages(self, chapters: list[ChapterInfo], shared_session: SharedSession, desc: str) -> None:
+        """Несколько threadmark часто на одной странице темы: качаем и парсим каждую страницу один раз"""
+        chapters_by_page = self._group_chapters_by_page(chapters)
+        logger.debug('%s глав на %s страницах', len(chapters), len(chapters_by_page))
+        download_concurrently(self.site_name, chapters_by_page.items(),
+                              lambda page: self._run_with_reconnect(partial(self._download_page_chapters, *page), shared_session), desc)
+
+    def _group_chapters_by_page(self, chapters: list[ChapterInfo]) -> dict[str, list[ChapterInfo]]:
+        chapters_by_page: dict[str, list[ChapterInfo]] = {}
+        for chapter in chapters:
+            chapters_by_page.setdefault(self._get_page_link(chapter), []).append(chapter)
+        return chapters_by_page
+
+    def _download_page_chapters(self, page_link: str, chapters: list[ChapterInfo], session: Session) -> None:
+        page_soup = self._get_thread_page_soup(page_link, chapters, session)
+        for chapter in chapters:
+            self._save_page_chapter(page_soup, chapter)
+
+    def _save_page_chapter(self, page_soup: BeautifulSoup, chapter: ChapterInfo) -> None:
+        chapter_soup = self._extract_chapter_soup(page_soup, chapter)
+        chapter_text = self._get_chapter_text(chapter_soup, chapter)
+        self._save_chapter_text_on_disk(chapter_text, chapter)
         # загрузку картинок отключил, ресурс заблокирован, нужно либо прокси, либо vpn
         # self._get_chapter_images(chapter_soup)
 
+    def _probe_book_updated(self, session: Session, book_updated_date_in_db: int) -> bool:
+        """Сравнивает дату последнего threadmark из сырого html страницы с датой в БД, без парсинга всей страницы и скрытых глав"""
+        logger.debug('Проверяем дату последнего threadmark')
+        response = cached_get(session, self.site_name + self.book_link)
+        if response.status_code != 200:
+            return True
+        self.threadmarks_page_source = response.text
+        last_threadmark_date = self._find_last_threadmark_date(self.threadmarks_page_source)
+        if last_threadmark_date is None:
+            logger.debug('Не удалось найти дату последнего threadmark, делаем полную проверку')
+            return True
+        logger.debug(f'{last_threadmark_date=}, {book_updated_date_in_db=}')
+        return last_threadmark_date > book_updated_date_in_db
+
+    @staticmethod
+    def _find_last_threadmark_date(page_source: str) -> int | None:
+        # скрытые главы (filler) всегда в середине списка, последний threadmark на странице всегда виден
+        last_threadmark = None
+        for threadmark in re.finditer(r'class="structItem structItem--threadmark([^"]*)"', page_source):
+            if 'filler' not in threadmark.group(1):
+                last_threadmark = threadmark
+        if last_threadmark is None:
+            return None
+        date_search = re.compile(r'<time[^>]*data-time="(\d+)"').search(page_source, last_threadmark.end())
+        return int(date_search.group(1)) if date_search else None
+
     def _get_sf_sb_soup(self, session: Session) -> BeautifulSoup:
         logger.debug('Получаем page sourse основной страницы книги')
-        response = session.get(self.site_name + self.book_link)
-        page_soup = create_soup(response.text)
+        if self.threadmarks_page_source:
+            page_source = self.threadmarks_page_source
+        else:
+            page_source = cached_get(session, self.site_name + self.book_link).text
+        page_soup = create_soup(page_source, required_selector='.threadmarkListingHeader-name')
         page_soup = self._open_hidden_chapters(page_soup, session)
         try:
             self._get_chapters_info(page_soup)
@@ -104,9 +208,11 @@ class SfSbBook(Book, BookDB, BookInfo):
         # в название атрибута добавляется unread, если глава не прочитана, и она пролетает мимо поиска, поэтому regex
         chapter_lines = page_soup.find_all('div', class_=re.compile(r"structItem structItem--threadmark\D*"))
         if chapter_lines:
+            chapter_links = {chapter_info.chapter_link for chapter_info in self.chapters_info_list}
             for number, chapter in enumerate(chapter_lines):
                 chapter_info = self._parse_chapter_info(number, chapter)
-                if chapter_info not in self.chapters_info_list:
+                if chapter_info.chapter_link not in chapter_links:
+                    chapter_links.add(chapter_info.chapter_link)
                     self.chapters_info_list.append(chapter_info)
 
         else:
@@ -283,29 +389,36 @@ class SfSbBook(Book, BookDB, BookInfo):
             logger.error(error_message)
             raise ParsingException(error_message)
 
-    def _get_chapter_soup(self, chapter_link: ChapterInfo, session: Session) -> BeautifulSoup:
-        post_id = self._get_post_id(chapter_link)
-        chapter_url = self.site_name + chapter_link.chapter_link
-        response = session.get(chapter_url)
+    def _get_thread_page_soup(self, page_link: str, chapters: list[ChapterInfo], session: Session) -> BeautifulSoup:
+        post_id = self._get_post_id(chapters[0])
+        response = session.get(self.site_name + page_link)
         if response.status_code == 200:
-            chapter_soup_raw = create_soup(response.text)
-            chapter_soup = chapter_soup_raw.find('article', {'data-content': post_id})
-            if chapter_soup and isinstance(chapter_soup, bs4.Tag):
-                chapter_soup = self._clean_soup(chapter_soup)
-            else:
-                error_message = f'Не могу выделить пост с текстом из общей страницы {chapter_link.chapter_link}'
-                logger.error(error_message)
-                raise ParsingException(error_message)
-            return chapter_soup
+            return create_soup(response.text, required_selector=f'article[data-content="{post_id}"]',
+                               parser_backends=CHAPTER_PARSER_BACKENDS['sf_sb'])
         else:
-            error_message = f'Не могу получить page sourse главы {chapter_link.chapter_link} в книге {self.book_link}'
+            error_message = f'Не могу получить page sourse страницы {page_link} в книге {self.book_link}'
             logger.error(error_message)
             raise GetPageSourseException(error_message)
 
+    def _extract_chapter_soup(self, page_soup: BeautifulSoup, chapter_link: ChapterInfo) -> bs4.Tag:
+        post_id = self._get_post_id(chapter_link)
+        chapter_soup = page_soup.find('article', {'data-content': post_id})
+        if chapter_soup and isinstance(chapter_soup, bs4.Tag):
+            return self._clean_soup(chapter_soup)
+        else:
+            error_message = f'Не могу выделить пост с текстом из общей страницы {chapter_link.chapter_link}'
+            logger.error(error_message)
+            raise ParsingException(error_message)
+
     @staticmethod
-    def _get_chapter_text(chapter_soup: BeautifulSoup) -> str:
+    def _get_page_link(chapter_link: ChapterInfo) -> str:
+        """Ссылка на страницу темы без якоря поста"""
+        return chapter_link.chapter_link.split('#')[0]
+
+    def _get_chapter_text(self, chapter_soup: bs4.Tag, chapter_info: ChapterInfo) -> str:
         chapter_text_raw = chapter_soup.find('div', class_="message-cell message-cell--main")
         if chapter_text_raw and isinstance(chapter_text_raw, bs4.Tag):
+            self._measure_chapter(chapter_info, chapter_text_raw.get_text())
             chapter_text = str(chapter_text_raw).strip()
             return chapter_text
         else:
@@ -314,7 +427,8 @@ class SfSbBook(Book, BookDB, BookInfo):
             raise ParsingException(error_message)
 
     @staticmethod
-    def _clean_soup(chapter_soup: bs4.Tag) -> BeautifulSoup:
+    def _clean_soup(chapter_soup: bs4.Tag) -> bs4.Tag:
+        """Чистит пост прямо в дереве страницы: страница уже разобрана один раз, повторно пост не парсим"""
         last_edit_block = chapter_soup.find('div', class_="message-lastEdit")
         if last_edit_block and isinstance(last_edit_block, bs4.Tag):
             last_edit_block.decompose()
@@ -326,8 +440,6 @@ class SfSbBook(Book, BookDB, BookInfo):
         message_footer = chapter_soup.find('footer', class_="message-footer")
         if message_footer and isinstance(message_footer, bs4.Tag):
             message_footer.decompose()
-
-        chapter_soup = create_soup(str(chapter_soup))
         return chapter_soup
 
     @staticmethod
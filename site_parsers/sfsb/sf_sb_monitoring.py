@@ -1,10 +1,11 @@
 import logging
-import time
+import random
 
 from tqdm import tqdm
 
 from common.request_authorization import create_auth_session
 from db_modules.db_common import get_monitoring_stories_list
+from settings.settings import CHAPTER_VERIFY_SAMPLE_SIZE
 from site_parsers.sfsb.sf_sb_book import SfSbBook
 
 logger = logging.getLogger(__name__)
@@ -17,5 +18,16 @@ def check_sf_sb_updates() -> None:
     for book_url_data in tqdm(monitoring_list, desc='Обход списка мониторинга sf_sb', colour='green'):
         book = SfSbBook(*book_url_data)
         book.downoload_book(session)
-        time.sleep(1)
     session.close()
+
+
+def verify_sf_sb_monitoring_book() -> None:
+    """Фоновая проверка глав одной случайной книги с мониторинга, со своей сессией и своим экземпляром книги"""
+    monitoring_list = get_monitoring_stories_list('sf_sb')
+    if not monitoring_list:
+        return
+    session = create_auth_session(site_alias='sf_sb')
+    try:
+        SfSbBook(*random.choice(monitoring_list)).verify_chapters(session, CHAPTER_VERIFY_SAMPLE_SIZE)
+    finally:
+        session.close()
@@ -6,7 +6,7 @@ from datetime import datetime
 from common.exceptions import ParsingException, GetPageSourseException
 from common.project_types import ChapterInfo
 from common.common import Book
-from common.utils import request_get_image
+from common.image_store import link_image, store_image
 from common.utils import create_soup
 from requests import Session
 from common.request_authorization import create_auth_session
@@ -60,19 +60,19 @@ class SolBook(SolRequestsSoup, Book):
         self._get_book_details(session)
 
     def _download_chapter(self, chapter_info: ChapterInfo, session: Session) -> None:
-        logger.debug(f'Скачиваем главу: {chapter_info.chapter_link}')
+        logger.debug('Скачиваем главу: %s', chapter_info.chapter_link)
         chapter_soup = self.get_chapter_soup(chapter_info.chapter_link, session)
         self._get_chapter(chapter_soup, chapter_info)
 
     def _get_chapter(self, chapter_soup: BeautifulSoup, chapter_info: ChapterInfo) -> ChapterInfo:
         logger.debug('Парсим текст главы')
-        chapter_soup = create_soup(str(chapter_soup.find('article')))
-        if chapter_soup:
-            chapter_info.chapter_posted_date, chapter_info.chapter_updated_date = self._get_chapter_dates(chapter_soup)
-            chapter_soup = self._clear_chapter_soup(chapter_soup)
-            chapter_soup = self._get_chapter_images(chapter_soup)
-            chapter_text = self._get_chapter_text(chapter_soup)
-            chapter_info.chapter_size = self._get_chapter_size(chapter_text)
+        # работаем с тэгом article в уже разобранной странице, без сериализации и повторного парсинга
+        article_soup = chapter_soup.find('article')
+        if article_soup and isinstance(article_soup, bs4.Tag):
+            chapter_info.chapter_posted_date, chapter_info.chapter_updated_date = self._get_chapter_dates(article_soup)
+            article_soup = self._clear_chapter_soup(article_soup)
+            article_soup = self._get_chapter_images(article_soup)
+            chapter_text = self._get_chapter_text(article_soup, chapter_info)
             self._save_chapter_text_on_disk(chapter_text, chapter_info)
         else:
             error_message = 'Не могу найти тэг article'
@@ -81,7 +81,7 @@ class SolBook(SolRequestsSoup, Book):
         return chapter_info
 
     @staticmethod
-    def _get_chapter_dates(chapter_soup: BeautifulSoup) -> tuple[int, int]:
+    def _get_chapter_dates(chapter_soup: bs4.Tag) -> tuple[int, int]:
         logger.debug('Получаем даты в главе')
         chapter_dates = chapter_soup.find_all('div', class_="date")
         posted_date, updated_date = 0, 0
@@ -96,11 +96,11 @@ class SolBook(SolRequestsSoup, Book):
             error_message = 'Ошибка получения дат в главе'
             logger.error(error_message)
             raise ParsingException(error_message)
-        logger.debug(f'{posted_date=}, {updated_date=}')
+        logger.debug('posted_date=%s, updated_date=%s', posted_date, updated_date)
         return posted_date, updated_date
 
     @staticmethod
-    def _clear_chapter_soup(chapter_soup: BeautifulSoup) -> BeautifulSoup:
+    def _clear_chapter_soup(chapter_soup: bs4.Tag) -> bs4.Tag:
         """функция для удаления со страницы даты, ссылки на слудующую главу, формы голосования и т.д."""
         logger.debug('Удаляем лишнее из текста')
         tags_to_clear: list[dict[str, dict[str, str]]] = [{'div': {'class': "date"}},
@@ -110,14 +110,15 @@ class SolBook(SolRequestsSoup, Book):
                                                           {'div': {'class': "vform"}}]
         for tag_type in tags_to_clear:
             tags_to_delete = chapter_soup.find_all(tag_type)
-            logger.debug(f'{tags_to_delete=}')
+            logger.debug('tags_to_delete=%s', tags_to_delete)
             for tag in tags_to_delete:
                 if tag and isinstance(tag, bs4.Tag):
                     tag.decompose()
         return chapter_soup
 
-    def _get_chapter_text(self, soup: BeautifulSoup) -> str:
+    def _get_chapter_text(self, soup: bs4.Tag, chapter_info: ChapterInfo) -> str:
         logger.debug('Получаем финальный текст главы')
+        self._measure_chapter(chapter_info, self._replace_unreadable_symbols(soup.get_text()))
         chapter_text = str(soup).strip()
         chapter_text = self._replace_unreadable_symbols(chapter_text)
         return chapter_text
@@ -151,6 +152,7 @@ class SolBook(SolRequestsSoup, Book):
         logger.debug('получаем список ссылок на главы')
         soup = book_soup.find('div', id="index-list")
         if soup and isinstance(soup, bs4.Tag):
+            chapter_links = {chapter_info.chapter_link for chapter_info in self.chapters_info_list}
             for link in enumerate(soup.findAll('a')):
                 chapter_info = ChapterInfo(
                     chapter_link=link[1].get('href'),
@@ -158,7 +160,8 @@ class SolBook(SolRequestsSoup, Book):
                     chapter_file_name=f'chapter_{str(link[0]).zfill(4)}.html',
                     book_link=self.book_link
                 )
-                if chapter_info not in self.chapters_info_list:
+                if chapter_info.chapter_link not in chapter_links:
+                    chapter_links.add(chapter_info.chapter_link)
                     self.chapters_info_list.append(chapter_info)
         else:
             logger.error('Не умею загружать короткие истории без списка глав')
@@ -170,18 +173,21 @@ class SolBook(SolRequestsSoup, Book):
         if cover_link:
             cover_link = cover_link.get('src')  # type: ignore
             assert isinstance(cover_link, str)
-            image_response = request_get_image(cover_link)
-            if image_response.status_code == 200:
-                image = image_response.content
-                book_cover_path = self.book_directory.joinpath('Images/_cover.jpg')
-                try:
-                    book_cover_path.write_bytes(image)
-                    logger.debug(f'обложку загрузили {book_cover_path}')
-                except FileNotFoundError as e:
-                    logger.exception(f'Не могу сохранить обложку книги {self.book_link} на диск')
-                    raise ParsingException(f'Не могу сохранить обложку на диск {e}')
-            else:
-                logger.error(f'Не могу загрузить обложку, {image_response.status_code=}')
+            try:
+                cover_path = store_image(cover_link)
+            except ParsingException:
+                logger.error(f'Не могу загрузить обложку {cover_link}')
+                return
+            if cover_path is None:
+                logger.error(f'Обложки нет на сайте {cover_link}')
+                return
+            book_cover_path = self.book_directory.joinpath('Images/_cover.jpg')
+            try:
+                link_image(cover_path, book_cover_path)
+                logger.debug(f'обложку загрузили {book_cover_path}')
+            except OSError as e:
+                logger.exception(f'Не могу сохранить обложку книги {self.book_link} на диск')
+                raise ParsingException(f'Не могу сохранить обложку на диск {e}')
         else:
             logger.debug('обложки нет')
 
@@ -283,7 +289,7 @@ class SolBook(SolRequestsSoup, Book):
     def _get_book_status(self, book_details: str) -> None:
         book_status_search = re.search(r'<b>Posted:</b>\D*\d{4}-\d{2}-\d{2}(\D*)<b>Updated:</b>', book_details)
         book_status_html = book_status_search.group(1) if book_status_search else '<p></p>'
-        book_status_raw = create_soup(book_status_html).find()
+        book_status_raw = create_soup(book_status_html, required_selector='html').find()
         book_status_raw = book_status_raw.get_text().strip()  # type: ignore
         assert isinstance(book_status_raw, str)
         if 'Incomplete' in book_status_raw:
@@ -1,6 +1,6 @@
 import logging
 import pickle
-import time
+import random
 from pathlib import Path
 from typing import Literal
 
@@ -11,11 +11,19 @@ from tqdm import tqdm
 from common.exceptions import GetPageSourseException, ParsingException
 from common.request_authorization import create_auth_session
 from common.utils import create_soup
-from db_modules.db_common import get_sol_monitoring_authors_list, get_monitoring_stories_list
+from db_modules.db_common import (get_monitoring_stories_list, get_sol_feed_links, get_sol_feed_watermark,
+                                  get_sol_monitoring_authors_list, save_sol_feed_links)
+from settings.settings import CHAPTER_VERIFY_SAMPLE_SIZE
 from site_parsers.sol.sol_book import SolBook
 
 logger = logging.getLogger(__name__)
 
+feed_type_list = Literal['upd', 'new']
+
+# до хранения просмотренных ссылок в БД списки лежали в pickle-файлах
+OLD_STORIES_LINK_FILES = {'upd': Path('temp/updated_stories_link_list.pickle'),
+                          'new': Path('temp/new_stories_link_list.pickle')}
+
 
 def check_sol_updates() -> None:
     logger.debug('Проверяемя страницу обновлений и страницу новых историй')
@@ -32,7 +40,6 @@ def _check_sol_updates_page(session: Session) -> None:
     for book_link in tqdm(upd_stories_list, desc='Скачивание обновленных книг sol', colour='green'):
         book = SolBook(book_link)
         book.downoload_book(session)
-        time.sleep(3)
 
 
 def _check_sol_new_story_page(session: Session) -> None:
@@ -42,27 +49,34 @@ def _check_sol_new_story_page(session: Session) -> None:
     for book_link in tqdm(new_stories_list, desc='Скачивание новых книг sol', colour='green'):
         book = SolBook(book_link)
         book.downoload_book(session)
-        time.sleep(3)
+
+
+def verify_sol_monitoring_book() -> None:
+    """Фоновая проверка глав одной случайной книги с мониторинга, со своей сессией и своим экземпляром книги"""
+    monitoring_list = get_monitoring_stories_list('sol')
+    if not monitoring_list:
+        return
+    book_link, _ = random.choice(monitoring_list)
+    session = create_auth_session(site_alias='sol')
+    try:
+        SolBook(book_link).verify_chapters(session, CHAPTER_VERIFY_SAMPLE_SIZE)
+    finally:
+        session.close()
 
 
 def get_new_stories_download_list(page_soup: BeautifulSoup) -> list[str]:
     link_list = _get_new_stories_link_list(page_soup)
-    monitoring_list = get_sol_monitoring_authors_list()
-    list_to_download = [link[1] for link in link_list if link[0] in monitoring_list]
+    if not link_list:
+        return []
+    monitoring_authors = set(get_sol_monitoring_authors_list())
+    list_to_download = [link[1] for link in link_list if link[0] in monitoring_authors]
     return list_to_download
 
 
 def _get_new_stories_link_list(soup: BeautifulSoup) -> list[tuple[str, str]]:
     new_stories_list = _get_new_links_from_soup(soup)
-    old_link_list = _load_old_stories_link_list('new')
-    new_link_list = []
-    for link in new_stories_list:
-        if link not in old_link_list:
-            new_link_list.append(link)
-        else:
-            break
-    _save_old_stories_link_list(new_stories_list, 'new')
-    return new_link_list
+    unseen_links = _get_unseen_feed_links([story_link for _, story_link in new_stories_list], 'new')
+    return new_stories_list[:len(unseen_links)]
 
 
 def _get_new_links_from_soup(soup: BeautifulSoup) -> list[tuple[str, str]]:
@@ -100,26 +114,19 @@ def _get_upd_new_page_soup(session: Session, page_type: Literal['new', 'upd']) -
 
 def _get_upd_stories_download_list(page_soup: BeautifulSoup) -> tuple[str, ...]:
     link_list = _get_updates_stories_link_list(page_soup)
-    logger.debug(f'{link_list=}')
-    monitoring_list = [link[0] for link in get_monitoring_stories_list('sol')]
-    logger.debug(f'{monitoring_list=}')
-    list_to_download = tuple(link for link in link_list if link in monitoring_list)
-    logger.debug(f'{list_to_download=}')
+    logger.debug('link_list=%s', link_list)
+    if not link_list:
+        return ()
+    monitoring_links = {link[0] for link in get_monitoring_stories_list('sol')}
+    list_to_download = tuple(link for link in link_list if link in monitoring_links)
+    logger.debug('list_to_download=%s', list_to_download)
 
     return list_to_download
 
 
 def _get_updates_stories_link_list(page_soup: BeautifulSoup) -> list[str]:
     updated_stories_list = _get_upd_links_from_soup(page_soup)
-    old_link_list = _load_old_stories_link_list('upd')
-    updated_link_list = []
-    for link in updated_stories_list:
-        if link not in old_link_list:
-            updated_link_list.append(link)
-        else:
-            break
-    _save_old_stories_link_list(updated_stories_list, 'upd')
-    return updated_link_list
+    return _get_unseen_feed_links(updated_stories_list, 'upd')
 
 
 def _get_upd_links_from_soup(page_soup: BeautifulSoup) -> list[str]:
@@ -128,40 +135,35 @@ def _get_upd_links_from_soup(page_soup: BeautifulSoup) -> list[str]:
     return updated_stories_list
 
 
-def _load_old_stories_link_list(stories_list_type: Literal['upd', 'new']) -> list[str]:
-    logger.debug('Читаем список ссылок с диска')
-    if stories_list_type == 'upd':
-        file_path = Path('temp/updated_stories_link_list.pickle')
-    elif stories_list_type == 'new':
-        file_path = Path('temp/new_stories_link_list.pickle')
-    else:
-        error_message = 'Неверно указан тип: new или upd'
-        logger.error(error_message)
-        raise GetPageSourseException(error_message)
-
-    if file_path.exists():
+def _get_unseen_feed_links(page_links: list[str], feed_type: feed_type_list) -> list[str]:
+    """Ссылки с начала страницы до первой уже просмотренной. Страница запоминается в БД вместо прошлой"""
+    if not page_links:
+        return []
+    watermark = get_sol_feed_watermark(feed_type)
+    if page_links[0] == watermark:
+        logger.debug('На странице %s нет новых записей', feed_type)
+        return []
+    seen_links = get_sol_feed_links(feed_type) if watermark is not None else _load_old_stories_link_set(feed_type)
+    unseen_links = []
+    for link in page_links:
+        if link in seen_links:
+            break
+        unseen_links.append(link)
+    save_sol_feed_links(feed_type, page_links)
+    return unseen_links
+
+
+def _load_old_stories_link_set(stories_list_type: feed_type_list) -> set[str]:
+    """Ссылки из старого pickle-файла, нужны один раз, пока в БД нет просмотренной страницы ленты"""
+    file_path = OLD_STORIES_LINK_FILES[stories_list_type]
+    if not file_path.exists():
+        return set()
+    logger.debug('Читаем список ссылок %s с диска', file_path)
+    try:
         with open(file_path, 'rb') as file:
             link_list = pickle.load(file)
-    else:
-        link_list = []
-    return link_list
-
-
-def _save_old_stories_link_list(link_list: list[str] | list[tuple[str, str]], stories_list_type: Literal['upd', 'new']) -> None:
-    logger.debug('сохраняем список ссылкок на диск')
-    if stories_list_type == 'upd':
-        file_path = Path('temp/updated_stories_link_list.pickle')
-    elif stories_list_type == 'new':
-        file_path = Path('temp/new_stories_link_list.pickle')
-    else:
-        error_message = 'Неверно указан тип: new или upd'
-        logger.error(error_message)
-        raise GetPageSourseException(error_message)
-
-    if Path('temp').exists():
-        with open(file_path, 'wb') as file:
-            pickle.dump(link_list, file)
-    else:
-        error_message = 'Отсутсвует папка temp'
-        logger.error(error_message)
-        raise GetPageSourseException(error_message)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        logger.exception(f'Не удалось прочитать {file_path}')
+        return set()
+    # в ленте новых историй хранились пары (автор, история)
+    return {link[1] if isinstance(link, tuple) else link for link in link_list}
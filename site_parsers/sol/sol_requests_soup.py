@@ -7,31 +7,39 @@ from common.project_types import BookInfo
 from bs4 import BeautifulSoup, Tag, NavigableString
 from requests import Session
 import logging
-from common.utils import create_soup
+from common.utils import CHAPTER_PARSER_BACKENDS, create_soup
 from common.exceptions import ParsingException
 
 logger = logging.getLogger(__name__)
 
+CONCURRENT_ACCESS_ERROR = '<h2>Error! Too many concurrent accesses. Try later.</h2>'
+
 
 class SolRequestsSoup(BookInfo):
     def get_book_soup(self, session: Session) -> BeautifulSoup:
         logger.debug('Получаем book_soup')
         book_url = self.site_name + self.book_link
         reponse = session.get(book_url)
-        if '<h2>Error! Too many concurrent accesses. Try later.</h2>' in reponse.text:
-            error_message = 'Error! Too many concurrent accesses. Try later.'
-            logger.error(error_message)
-            raise ParsingException(error_message)
-        book_soup = create_soup(reponse.text)
+        self._check_concurrent_access(reponse.text)
+        book_soup = create_soup(reponse.text, required_selector='a[rel="author"]')
         return book_soup
 
     def get_chapter_soup(self, chapter_link: str, session: Session) -> BeautifulSoup:
         chapter_url = self.site_name + chapter_link
         response = session.get(chapter_url)
-        chapter_soup_1 = create_soup(response.text.strip())
+        self._check_concurrent_access(response.text)
+        chapter_soup_1 = create_soup(response.text.strip(), required_selector='article',
+                                     parser_backends=CHAPTER_PARSER_BACKENDS['sol'])
         chapter_soup_full = self._get_chapter_content_2(session, chapter_soup_1)
         return chapter_soup_full
 
+    @staticmethod
+    def _check_concurrent_access(page_source: str) -> None:
+        if CONCURRENT_ACCESS_ERROR in page_source:
+            error_message = 'Error! Too many concurrent accesses. Try later.'
+            logger.error(error_message)
+            raise ParsingException(error_message)
+
     def _get_chapter_content_2(self, session: Session, chapter_soup_1: BeautifulSoup) -> BeautifulSoup:
         bot_protection_block = chapter_soup_1.find('div', id="sr")
         if bot_protection_block:
@@ -52,7 +60,8 @@ class SolRequestsSoup(BookInfo):
             logger.debug('Обошли первый шаг защиты')
             if response.status_code == 200 and len(response.text) > 100:
                 logger.debug('Обошли второй шаг защиты')
-                chapter_soup_2 = create_soup('\n' + response.text.strip()).find()
+                chapter_soup_2 = create_soup('\n' + response.text.strip(), required_selector='html',
+                                             parser_backends=CHAPTER_PARSER_BACKENDS['sol']).find()
                 assert isinstance(chapter_soup_2, bs4.PageElement)
                 tag = chapter_soup_1.find('div', id="sr")
                 if tag:
@@ -74,7 +83,7 @@ class SolRequestsSoup(BookInfo):
         if temp_data:
             raw_data = self._extract_data_1(temp_data)
             data = [('cmd', "gt")] + [('data[]', i) for i in raw_data]
-            logger.debug(f'Токен {data=}')
+            logger.debug('Токен data=%s', data)
             return data
         else:
             error_message = f'Ошибка получения блока данных с токеном главы книги'
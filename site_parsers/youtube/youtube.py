@@ -1,25 +1,60 @@
 import logging
 import pickle
-import sqlite3 as sq
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import timedelta
 from pathlib import Path
 
 import isodate
-import requests
-from bs4 import BeautifulSoup
 from google.auth.exceptions import RefreshError
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build as youtube_build_session
+from requests import Session
+from requests.exceptions import RequestException
 from tqdm import tqdm
 
 from common.exceptions import GetPageSourseException
-from common.utils import create_soup
+from common.http_cache import cached_get, is_cached_response
+from common.request_authorization import create_request_session
 from common.utils import send_telegram_message
+from db_modules.db_youtube import (filter_new_rss_links, read_recent_rss_entries, read_youtube_subscriptions,
+                                   save_rss_entries, seed_recent_rss_entries, write_youtube_subscriptions)
+from settings.settings import YOUTUBE_SUBSCRIPTIONS_TTL
 
 logger = logging.getLogger(__name__)
 
+RSS_FETCH_WORKERS = 8
+# до переноса в БД последние посты для rss-ленты хранились здесь
+OLD_RSS_ENTRIES_FILE = Path('temp/rss.pickle')
+# максимум id в одном запросе videos().list
+VIDEOS_LIST_BATCH_SIZE = 50
+# максимальный размер страницы subscriptions().list
+SUBSCRIPTIONS_PAGE_SIZE = 50
+RSS_NAMESPACES = {'atom': 'http://www.w3.org/2005/Atom',
+                  'yt': 'http://www.youtube.com/xml/schemas/2015',
+                  'media': 'http://search.yahoo.com/mrss/'}
+# сохраненные записи ленты сериализуются с префиксами самой ленты, а не ns0/ns1
+ET.register_namespace('', RSS_NAMESPACES['atom'])
+ET.register_namespace('yt', RSS_NAMESPACES['yt'])
+ET.register_namespace('media', RSS_NAMESPACES['media'])
+
+
+@dataclass
+class RssEntry:
+    video_id: str
+    video_link: str
+    author: str
+    entry_xml: str
+
+
+_subscriptions_refresh_thread: threading.Thread | None = None
+_subscriptions_refresh_lock = threading.Lock()
+
 
 def form_rss_list(id_lst: list) -> list[str]:
     """ Функция формирует список rss-каналов"""
@@ -40,22 +75,28 @@ def get_subscription_ids(resp: dict, id_lst: list[str] | None = None) -> list[st
     return id_lst
 
 
-def get_video_duration(youtube_session: youtube_build_session, video_id: str) -> str:
-    request = youtube_session.videos().list(part='contentDetails', id=video_id)
-    response = request.execute()['items'][0]['contentDetails']['duration']
-    duration = isodate.parse_duration(response)
-    duration = timedelta(seconds=duration.total_seconds())
-    return str(duration)
+def get_videos_durations(youtube_session: youtube_build_session, video_ids: list[str]) -> dict[str, str]:
+    """Длительности видео пачками по VIDEOS_LIST_BATCH_SIZE id за запрос"""
+    durations = {}
+    for start in range(0, len(video_ids), VIDEOS_LIST_BATCH_SIZE):
+        video_ids_batch = video_ids[start:start + VIDEOS_LIST_BATCH_SIZE]
+        request = youtube_session.videos().list(part='contentDetails', id=','.join(video_ids_batch), maxResults=VIDEOS_LIST_BATCH_SIZE)
+        for item in request.execute()['items']:
+            duration = isodate.parse_duration(item['contentDetails']['duration'])
+            durations[item['id']] = str(timedelta(seconds=duration.total_seconds()))
+    return durations
 
 
-def _create_channel_id_list(youtube_session: Credentials) -> list[str]:
+def _create_channel_id_list(youtube_session: youtube_build_session) -> tuple[list[str], int]:
+    """Полный список подписок страницами максимального размера. Возвращает id каналов и количество подписок"""
     logger.debug('Получаем первый лист с youtube подписками')
     request = youtube_session.subscriptions().list(part='snippet',
                                                    mine=True,  # авторизация по моему аккаунту
-                                                   maxResults=10,
+                                                   maxResults=SUBSCRIPTIONS_PAGE_SIZE,
                                                    order='alphabetical'
                                                    )
     response = request.execute()
+    total_results = response['pageInfo']['totalResults']
     id_list = get_subscription_ids(response)
 
     # в цикле перебираем следующие страницы
@@ -67,50 +108,126 @@ def _create_channel_id_list(youtube_session: Credentials) -> list[str]:
         response = request.execute()
 
         id_list += get_subscription_ids(response)
+    return id_list, total_results
+
+
+def _get_subscriptions_count(youtube_session: youtube_build_session) -> int:
+    request = youtube_session.subscriptions().list(part='id', mine=True, maxResults=1)
+    total_results: int = request.execute()['pageInfo']['totalResults']
+    return total_results
+
+
+def _get_channel_id_list(session_token: Credentials, youtube_session: youtube_build_session) -> list[str]:
+    """Список подписок из кэша в БД. Кэш проверяется и обновляется в фоне, проверка youtube его не ждет.
+    Синхронно список запрашивается только если кэша еще нет"""
+    id_list, _, refreshed_date = read_youtube_subscriptions()
+    if not refreshed_date:
+        logger.debug('Кэша подписок нет, получаем список подписок')
+        id_list, total_results = _create_channel_id_list(youtube_session)
+        write_youtube_subscriptions(id_list, total_results)
+        return id_list
+    _start_subscriptions_refresh(session_token)
     return id_list
 
 
+def _start_subscriptions_refresh(session_token: Credentials) -> None:
+    global _subscriptions_refresh_thread
+    with _subscriptions_refresh_lock:
+        if _subscriptions_refresh_thread is not None and _subscriptions_refresh_thread.is_alive():
+            return
+        _subscriptions_refresh_thread = threading.Thread(target=_refresh_subscriptions, args=(session_token,),
+                                                         name='youtube-subscriptions', daemon=True)
+        _subscriptions_refresh_thread.start()
+
+
+def _refresh_subscriptions(session_token: Credentials) -> None:
+    """Обновляет кэш подписок, если истек YOUTUBE_SUBSCRIPTIONS_TTL или изменилось количество подписок"""
+    try:
+        # клиент google api нельзя делить между потоками, у фонового обновления своя сессия
+        youtube_session = _create_youtube_session(session_token)
+        _, cached_total_results, refreshed_date = read_youtube_subscriptions()
+        if time.time() - refreshed_date < YOUTUBE_SUBSCRIPTIONS_TTL:
+            total_results = _get_subscriptions_count(youtube_session)
+            if total_results == cached_total_results:
+                logger.debug('Количество подписок не изменилось, кэш подписок актуален')
+                return
+        logger.debug('Обновляем кэш подписок')
+        id_list, total_results = _create_channel_id_list(youtube_session)
+        write_youtube_subscriptions(id_list, total_results)
+    except Exception:
+        logger.exception('Ошибка обновления кэша подписок youtube')
+
+
 def _process_videos(id_list: list[str], youtube_session: youtube_build_session) -> None:
+    _seed_recent_rss_entries()
+    # ленты всех каналов качаем параллельно, новые видео собираем в один список для пакетного запроса длительностей
+    session = create_request_session()
+    try:
+        rss_feeds = _get_rss_feeds(id_list, session)
+    finally:
+        session.close()
+    rss_posts_by_link = {rss_post.video_link: rss_post for rss_posts in rss_feeds for rss_post in rss_posts}
+    new_links = filter_new_rss_links(rss_posts_by_link)
+    new_entries = [rss_post for video_link, rss_post in rss_posts_by_link.items() if video_link in new_links]
+    logger.debug('Новых видео %s из %s', len(new_entries), len(rss_posts_by_link))
+    if not new_entries:
+        return
+    videos_durations = get_videos_durations(youtube_session, [rss_post.video_id for rss_post in new_entries])
+    save_rss_entries([(rss_post.video_link, rss_post.entry_xml) for rss_post in new_entries])
+    for rss_post in new_entries:
+        message = f'{rss_post.author}\nДлительность:{videos_durations.get(rss_post.video_id, "?")}\n{rss_post.video_link}\n'
+        print(message)
+        send_telegram_message('youtube_chat', message)
+
+
+def _seed_recent_rss_entries() -> None:
+    """Переносит посты из старого pickle-файла в rss_recent, нужно один раз, пока rss_recent пуста"""
+    if not OLD_RSS_ENTRIES_FILE.exists() or read_recent_rss_entries():
+        return
+    logger.debug('Переносим посты из %s в БД', OLD_RSS_ENTRIES_FILE)
+    try:
+        with open(OLD_RSS_ENTRIES_FILE, 'rb') as file:
+            entries_xml = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        logger.exception(f'Не удалось прочитать {OLD_RSS_ENTRIES_FILE}')
+        return
+    seed_recent_rss_entries([str(entry_xml) for entry_xml in entries_xml])
+
+
+def _get_rss_feeds(id_list: list[str], session: Session) -> list[list[RssEntry]]:
+    with ThreadPoolExecutor(max_workers=RSS_FETCH_WORKERS) as executor:
+        rss_feeds = list(tqdm(executor.map(lambda channel_id: _get_channel_rss_posts(channel_id, session), id_list),
+                              total=len(id_list), desc='YouTube channels:', colour='blue'))
+    return rss_feeds
+
+
+def _get_channel_rss_posts(channel_id: str, session: Session) -> list[RssEntry]:
+    """Ошибка одного канала (пустая лента, битый xml, таймаут) не должна отменять ленты остальных каналов"""
     try:
-        with open('temp/rss.pickle', 'rb') as f:
-            entries_current = pickle.load(f)  # загружаем список всех постов, что идут на rss ленту
-    except (EOFError, FileNotFoundError):
-        entries_current = []
-    print('Загрузили с диска', len(entries_current))
-
-    # проходимся по всем лентам, разбиваем на блоки, и если отсутсвует в общем списке записываем
-    for channel_id in tqdm(id_list, desc='YouTube channels:', colour='blue'):
-        rss_posts = _get_rss_posts(channel_id)
-        with sq.connect('book_database/rss_entries.db') as rss_db:
-            cur = rss_db.cursor()
-            for rss_post in rss_posts:
-                video_link = BeautifulSoup(rss_post, 'lxml').find('link').get('href')  # type: ignore # извлекаем ссылку на видео
-                video_id = video_link.split('v=')[-1]  # type: ignore # получаем id видео из ссылки
-                author = BeautifulSoup(rss_post, 'lxml').find('name').text  # type: ignore
-                cur.execute("""SELECT rss_entry FROM rss_all WHERE rss_entry = ?""", (video_link,))
-                if cur.fetchone() is None:
-                    video_duration = get_video_duration(youtube_session, video_id)
-                    cur.execute("""INSERT INTO rss_all VALUES (?)""", (video_link,))
-                    message = f'{author}\nДлительность:{video_duration}\n{video_link}\n'
-                    print(message)
-                    send_telegram_message('youtube_chat', message)
-                    entries_current.insert(0, rss_post)
-    if len(entries_current) > 100:
-        entries_current = entries_current[:100]
-
-    with open('temp/rss.pickle', 'wb') as f:
-        pickle.dump(entries_current, f)
-
-
-def _get_rss_posts(channel_id: str) -> list[str]:
-    logger.debug('Получаем rss-ленту из по id канала')
+        return _get_rss_posts(channel_id, session)
+    except (GetPageSourseException, RequestException):
+        logger.exception(f'Пропускаем rss-ленту канала {channel_id=}')
+        return []
+
+
+def _get_rss_posts(channel_id: str, session: Session) -> list[RssEntry]:
+    logger.debug('Получаем rss-ленту из по id канала %s', channel_id)
     rss_url = f'https://www.youtube.com/feeds/videos.xml?channel_id={channel_id}'
-    response = requests.get(rss_url, timeout=3)  # получаем ленту
+    response = cached_get(session, rss_url, timeout=3)  # получаем ленту
+    if is_cached_response(response):
+        # лента не изменилась с прошлой проверки, ее посты уже сверены с rss_all. Если прошлый цикл упал до записи
+        # в БД, эти посты найдутся при следующем изменении ленты
+        logger.debug('rss-лента канала %s не изменилась', channel_id)
+        return []
     if response.status_code == 200:
-        soup = create_soup(response.text)
-        rss_posts_tags = soup.findAll('entry')  # разделяем ленту на посты
-        if rss_posts_tags:
-            rss_posts = [str(post) for post in rss_posts_tags]
+        try:
+            feed = ET.fromstring(response.content)
+        except ET.ParseError:
+            error_message = f'Ошибка разбора rss-ленты канала {channel_id=}'
+            logger.exception(error_message)
+            raise GetPageSourseException(error_message)
+        rss_posts = [_parse_rss_entry(entry) for entry in feed.iterfind('atom:entry', RSS_NAMESPACES)]  # разделяем ленту на посты
+        if rss_posts:
             return rss_posts
         else:
             error_message = f'rss-лента канала {channel_id=} пуста'
@@ -122,6 +239,15 @@ def _get_rss_posts(channel_id: str) -> list[str]:
         raise GetPageSourseException(error_message)
 
 
+def _parse_rss_entry(entry: ET.Element) -> RssEntry:
+    video_link_tag = entry.find('atom:link[@rel="alternate"]', RSS_NAMESPACES)
+    video_link = video_link_tag.get('href', '') if video_link_tag is not None else ''
+    video_id = entry.findtext('yt:videoId', default='', namespaces=RSS_NAMESPACES) or video_link.split('v=')[-1]
+    author = entry.findtext('atom:author/atom:name', default='', namespaces=RSS_NAMESPACES)
+    return RssEntry(video_id=video_id, video_link=video_link, author=author,
+                    entry_xml=ET.tostring(entry, encoding='unicode'))
+
+
 def _get_valid_token() -> Credentials:
     session_token = _load_youtube_session_token()
     if session_token is None:# or not session_token.valid:
@@ -199,5 +325,5 @@ def _create_youtube_session(session_token: Credentials) -> youtube_build_session
 def check_youtube_rss() -> None:
     session_token = _get_valid_token()
     youtube_session = _create_youtube_session(session_token)
-    id_list = _create_channel_id_list(youtube_session)
+    id_list = _get_channel_id_list(session_token, youtube_session)
     _process_videos(id_list, youtube_session)